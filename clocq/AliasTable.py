@@ -0,0 +1,56 @@
+import sys
+import time
+
+from clocq.LocalSearch import iterate_kb_item_names, tokenize
+from clocq.PostingsIndex import PostingsIndex
+
+
+def normalize(string):
+    """Normalize the string for exact matching: lowercase, no punctuation, single whitespaces."""
+    return " ".join(tokenize(string))
+
+
+class AliasTable:
+    """
+    Exact-match table: normalized label/alias -> KB items with this label or alias,
+    sorted by KB frequency (descending). Built once for the KB, and stored in
+    memory-mappable files (see PostingsIndex). Consulted by the CandidateList before
+    the (more costly) search engine: question words often match a label or alias exactly.
+    """
+
+    def __init__(self, kb, path_to_alias_table):
+        self.kb = kb
+        self.index = PostingsIndex(path_to_alias_table)
+
+    def lookup(self, term, number_of_results=20):
+        """Retrieve the (most frequent) KB items with the term as label or alias."""
+        document_ids, _ = self.index.get_postings(normalize(term), limit=number_of_results)
+        return [self.kb.integer_to_item(int(document_id)) for document_id in document_ids]
+
+    @staticmethod
+    def build(kb, path_to_alias_table, verbose=True):
+        """Create the alias table for all KB items."""
+        start = time.time()
+
+        def get_documents():
+            for integer_encoded_item, _, names in iterate_kb_item_names(kb):
+                keys = list({normalize(name) for name in names} - {""})
+                if keys:
+                    yield integer_encoded_item, keys
+
+        def get_document_weight(integer_encoded_item):
+            return sum(kb.get_frequency(kb.integer_to_item(integer_encoded_item)))
+
+        PostingsIndex.build(get_documents, path_to_alias_table, get_document_weight=get_document_weight)
+        if verbose:
+            print(f"Alias table stored in {path_to_alias_table} ({time.time() - start}s)")
+
+
+if __name__ == "__main__":
+    from clocq import config
+    from clocq.knowledge_base.KnowledgeBase import KnowledgeBase
+
+    # the full KB is required for the KB frequencies
+    kb = KnowledgeBase(config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS)
+    path_to_alias_table = sys.argv[1] if len(sys.argv) > 1 else config.PATH_TO_ALIAS_TABLE
+    AliasTable.build(kb, path_to_alias_table)
@@ -1,3 +1,4 @@
+import copy
 import json
 import pickle
 import random
@@ -37,8 +38,14 @@ class CLOCQ:
             config.PATH_TO_STOPWORDS,
             config.PATH_TO_WIKI2VEC_MODEL,
             config.PATH_TO_WIKIPEDIA_MAPPINGS,
-            config.PATH_TO_NORM_CACHE,
             wikidata_search_cache=wikidata_search_cache,
+            path_to_embedding_store=config.PATH_TO_EMBEDDING_STORE,
+            path_to_local_search_index=config.PATH_TO_LOCAL_SEARCH_INDEX,
+            path_to_alias_table=config.PATH_TO_ALIAS_TABLE,
+            path_to_trigram_index=config.PATH_TO_TRIGRAM_INDEX,
+            wikidata_search_url=config.WIKIDATA_SEARCH_URL,
+            number_of_processes=config.NUMBER_OF_PROCESSES,
+            path_to_timings_log=config.PATH_TO_TIMINGS_LOG,
         )
 
         # define regex pattern
@@ -143,17 +150,59 @@ class CLOCQ:
         Extract a question-specific context for the given question using the CLOCQ algorithm.
         Returns k (context tuple, context graph)-pairs for the given questions,
         i.e. a mapping of question words to KB items and a question-relevant KG subset.
-        In case the dict is empty, the default CLOCQ parameters are used
-        """
-        if not parameters:
-            parameters = config.DEF_PARAMS
-        else:
-            new_parameters = config.DEF_PARAMS
-            for key in parameters:
-                new_parameters[key] = parameters[key]
-            parameters = new_parameters
+        In case the dict is empty, the default CLOCQ parameters are used.
+        An optional "deadline_ms" parameter sets a latency budget: once the budget
+        gets tight, the algorithm degrades gracefully, and reports the
+        degradations applied in the "degradations" key of the result.
+        With the "timings" parameter set, the time spent in the individual stages
+        (and counts, e.g. of connectivity checks) are reported in the "timings" key.
+        """
+        parameters = CLOCQ.merge_parameters(parameters)
         return self.clocq.get_seach_space(question, parameters=parameters, include_labels=include_labels, include_type=include_type)
 
+    async def aget_search_space(self, question, parameters=dict(), include_labels=True, include_type=False):
+        """
+        Same as get_search_space, for use within asyncio (e.g. in an async web server):
+        the NER and the searches are awaited, and the CPU-bound stages run on a thread pool,
+        so that concurrent requests do not block the event loop.
+        """
+        parameters = CLOCQ.merge_parameters(parameters)
+        return await self.clocq.aget_search_space(question, parameters, include_labels=include_labels, include_type=include_type)
+
+    def get_search_spaces(self, questions, parameters=dict(), include_labels=True, include_type=False):
+        """
+        Extract question-specific contexts for a list of questions using the CLOCQ algorithm
+        (same result as get_search_space for each question, in the same order).
+        Work is shared among the questions: question words are extracted in batches, and candidates,
+        connectivity checks and neighborhoods are computed only once for repeated question words and KB items.
+        """
+        parameters = CLOCQ.merge_parameters(parameters)
+        return self.clocq.get_search_spaces(
+            questions,
+            parameters=parameters,
+            include_labels=include_labels,
+            include_type=include_type,
+            ner_batch_size=config.NER_BATCH_SIZE,
+            ner_processes=config.NER_PROCESSES,
+        )
+
+    @staticmethod
+    def merge_parameters(parameters):
+        """Returns the default CLOCQ parameters (see config.DEF_PARAMS), overridden by the given parameters (if any)."""
+        merged_parameters = copy.deepcopy(config.DEF_PARAMS)
+        if parameters:
+            merged_parameters.update(parameters)
+        return merged_parameters
+
+    def precompute_question_words(self, questions):
+        """
+        Extract the question words for a list of questions in batches (faster with spaCy/stanza NER).
+        Subsequent calls of get_search_space for these questions use the precomputed question words.
+        """
+        self.clocq.precompute_question_words(
+            questions, batch_size=config.NER_BATCH_SIZE, n_process=config.NER_PROCESSES
+        )
+
     def is_wikidata_entity(self, string):
         """
         Check whether the given string can be a wikidata entity.
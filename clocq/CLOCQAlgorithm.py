@@ -1,16 +1,37 @@
+import asyncio
+import functools
 import json
+import os
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-import spacy
-import stanza
-from networkx import json_graph
 from rank_bm25 import BM25Okapi
 
+from clocq.AliasTable import AliasTable
 from clocq.CoherenceGraph import CoherenceGraph, CoherenceScoreProcessor
 from clocq.ConnectivityGraph import ConnectivityGraph, ConnectivityScoreProcessor
+from clocq.LazyScoreProcessor import LazyScoreProcessor
+from clocq.LRUCache import LRUCache
+from clocq.Metrics import LATENCY_BUCKETS, SIZE_BUCKETS
+from clocq.ProcessPoolEngine import ProcessPoolEngine
+from clocq.SharedCaches import SharedCaches
+from clocq.StageTimings import StageTimings
+from clocq.LocalSearch import LocalSearch
+from clocq.LatencyBudget import (
+    LOWER_P_FRACTION,
+    REDUCE_DEPTH_FRACTION,
+    RESTRICT_CONNECTIVITY_FRACTION,
+    RESTRICTED_CONNECTIVITY_DEPTH,
+    SKIP_COHERENCE_FRACTION,
+    LatencyBudget,
+)
 from clocq.StringLibrary import StringLibrary
+from clocq.TaskScheduler import TaskScheduler
+from clocq.Tokenizer import Tokenizer
 from clocq.TopkProcessor import TopkProcessor
+from clocq.TrigramIndex import TrigramIndex
+from clocq.WikidataSearch import WIKIDATA_API_URL, WikidataSearch
 from clocq.Wikipedia2VecRelevance import Wikipedia2VecRelevance
 
 
@@ -24,57 +45,358 @@ class CLOCQAlgorithm:
         path_to_stopwords,
         path_to_wiki2vec_model,
         path_to_wikipedia_mappings,
-        path_to_norm_cache=None,
         wikidata_search_cache=None,
         verbose=False,
+        path_to_embedding_store=None,
+        path_to_local_search_index=None,
+        path_to_alias_table=None,
+        path_to_trigram_index=None,
+        wikidata_search_url=WIKIDATA_API_URL,
+        question_words_cache_size=100000,
+        number_of_processes=0,
+        path_to_timings_log=None,
+        metrics=None,
     ):
         self.kb = kb
         self.method_name = method_name
         self.string_lib = string_lib
-        self.wiki2vec = Wikipedia2VecRelevance(self.kb, path_to_stopwords, path_to_wiki2vec_model, path_to_wikipedia_mappings, path_to_norm_cache)
+        self.wiki2vec = Wikipedia2VecRelevance(
+            self.kb,
+            path_to_stopwords,
+            path_to_wiki2vec_model,
+            path_to_wikipedia_mappings,
+            path_to_embedding_store=path_to_embedding_store,
+        )
+        # connectivity and coherence blocks are computed in worker processes (if set), in threads otherwise
+        # (forked first, before any thread pools or connections of the search engine are created)
+        if number_of_processes:
+            self.engine = ProcessPoolEngine(self.kb, self.wiki2vec, number_of_processes)
+        else:
+            self.engine = None
         self.wikidata_search_cache = wikidata_search_cache
+        # local search engine for candidates (if available), the Wikidata search is used otherwise
+        # (one client shared by all question words and requests)
+        if path_to_local_search_index and os.path.exists(path_to_local_search_index):
+            self.search_engine = LocalSearch(self.kb, path_to_local_search_index)
+        else:
+            self.search_engine = WikidataSearch(cache=wikidata_search_cache, url=wikidata_search_url)
+        # exact-match fast path for candidates (if available)
+        if path_to_alias_table and os.path.exists(path_to_alias_table):
+            self.alias_table = AliasTable(self.kb, path_to_alias_table)
+        else:
+            self.alias_table = None
+        # typo-tolerant search for candidates (if available, requires the alias table)
+        if self.alias_table and path_to_trigram_index and os.path.exists(path_to_trigram_index):
+            self.trigram_index = TrigramIndex(self.alias_table, path_to_trigram_index)
+        else:
+            self.trigram_index = None
         self.verbose = verbose
 
-        # NER specific setting of nlp object
+        # NER specific setting of nlp object (loaded on first use)
         self.ner = ner
-        if ner == "stanza":
-            self.nlp = stanza.Pipeline(lang="en", processors="tokenize,ner")
-        elif ner == "spacy":
-            self.nlp = spacy.load("en_core_web_sm")
-        else:
-            self.nlp = None
+        self.nlp_pipeline = None
+        self.nlp_lock = threading.Lock()
+        # question words of questions (precomputed in batches, or seen before)
+        self.question_words_cache = LRUCache(question_words_cache_size)
+        # stages of the requests are run as tasks on a shared thread pool
+        self.scheduler = TaskScheduler()
+
+        # tokenizer for BM25
+        self.tokenizer = Tokenizer(path_to_stopwords)
 
-        # load stopwords for BM25
-        with open(path_to_stopwords, "r") as file:
-            self.stopwords = file.read().split("\n")
+        # timings of the requests (if enabled via the "timings" parameter) are appended to the log (if set)
+        self.path_to_timings_log = path_to_timings_log
+        self.timings_log_lock = threading.Lock()
+        if path_to_timings_log and os.path.dirname(path_to_timings_log):
+            os.makedirs(os.path.dirname(path_to_timings_log), exist_ok=True)
+        # metrics (optional, see Metrics): the timings are recorded for all requests then
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.histogram(
+                "clocq_stage_seconds", "Wall time of the stages of search space requests.", LATENCY_BUCKETS
+            )
+            metrics.histogram(
+                "clocq_search_space_size",
+                "Sizes of search space requests (question words, candidates, connectivity checks, KB items, facts).",
+                SIZE_BUCKETS,
+            )
+        # hits and misses of the caches shared within batches (accumulated over all batches)
+        self.batch_cache_statistics = dict()
+        self.batch_cache_statistics_lock = threading.Lock()
+
+    @property
+    def nlp(self):
+        """The pipeline of the NER method (spaCy or stanza), loaded on first use. None for other methods."""
+        if self.nlp_pipeline is None and self.ner in ("spacy", "stanza"):
+            with self.nlp_lock:
+                if self.nlp_pipeline is None:
+                    self.nlp_pipeline = self.string_lib.load_NER_pipeline(self.ner)
+        return self.nlp_pipeline
+
+    def precompute_question_words(self, questions, batch_size=64, n_process=1):
+        """
+        Extract the question words for a list of questions in batches (see StringLibrary.get_question_words_batch),
+        which is faster with spaCy or stanza NER. The question words are used when the search spaces are retrieved.
+        """
+        questions = [question for question in dict.fromkeys(questions) if not question in self.question_words_cache]
+        question_words_list = self.string_lib.get_question_words_batch(
+            questions, self.ner, self.nlp, batch_size=batch_size, n_process=n_process
+        )
+        for question, question_words in zip(questions, question_words_list):
+            # questions the NER failed for are retried once the search space is retrieved
+            if question_words is not None:
+                self.question_words_cache.store(question, question_words)
+
+    def get_question_words(self, question):
+        """
+        Extract the question words from the question (precomputed question words are used if available).
+        If the NER fails, each word is considered individually, and the question words are not cached.
+        """
+        found, question_words = self.question_words_cache.lookup(question)
+        if not found:
+            question_words = self.string_lib.get_question_words(question, self.ner, self.nlp)
+            if question_words is None:
+                question_words = self.string_lib.get_question_words(question, None)
+            else:
+                self.question_words_cache.store(question, question_words)
+        return list(question_words)
 
     def get_seach_space(self, question, parameters, include_labels=True, include_type=False):
+        """Extract the search space for the question, using the given parameters."""
+        return self.get_search_space_configurations(
+            question, [parameters], include_labels=include_labels, include_type=include_type
+        )[0]
+
+    def get_search_spaces(
+        self,
+        questions,
+        parameters,
+        include_labels=True,
+        include_type=False,
+        number_of_threads=8,
+        ner_batch_size=64,
+        ner_processes=1,
+    ):
+        """
+        Extract the search spaces for a batch of questions, using the given parameters.
+        The question words of all questions are extracted in batches (see precompute_question_words), and candidates,
+        connectivity checks, embeddings and neighborhoods of KB items are shared among the questions (see SharedCaches).
+        The questions are processed concurrently. Returns one result per question (in the same order).
+        """
+        self.precompute_question_words(questions, batch_size=ner_batch_size, n_process=ner_processes)
+        shared_caches = SharedCaches()
+
+        def get_search_space(question):
+            return self.get_search_space_configurations(
+                question,
+                [parameters],
+                include_labels=include_labels,
+                include_type=include_type,
+                shared_caches=shared_caches,
+            )[0]
+
+        with ThreadPoolExecutor(max_workers=number_of_threads) as executor:
+            results = list(executor.map(get_search_space, questions))
+        shared_cache_statistics = shared_caches.get_statistics()
+        self._print_verbose(("Shared caches", shared_cache_statistics))
+        with self.batch_cache_statistics_lock:
+            for name, statistics in shared_cache_statistics.items():
+                hits, misses = self.batch_cache_statistics.get(name, (0, 0))
+                self.batch_cache_statistics[name] = (hits + statistics["hits"], misses + statistics["misses"])
+        return results
+
+    def get_cache_statistics(self):
+        """
+        Returns the statistics (hits, misses, hit ratio,...) of the caches. The statistics of
+        the caches shared within batches (see get_search_spaces) are accumulated over all batches.
+        """
+        statistics = {
+            "question_words": self.question_words_cache.get_statistics(),
+            "phrase_embeddings": self.wiki2vec.phrase_cache.get_statistics(),
+            "tagme_ner": self.string_lib.tagme_NER_cache.get_statistics(),
+        }
+        if self.wikidata_search_cache:
+            statistics["wikidata_search"] = self.wikidata_search_cache.get_statistics()
+        # connectivity checks of the KB (if cached)
+        if getattr(self.kb, "use_connectivity_cache", False):
+            statistics["connectivity"] = self.kb.get_connectivity_cache_statistics()
+        with self.batch_cache_statistics_lock:
+            for name, (hits, misses) in self.batch_cache_statistics.items():
+                statistics["batch_" + name] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": hits / (hits + misses) if hits + misses else 0,
+                }
+        return statistics
+
+    def get_search_space_configurations(
+        self, question, parameter_list, include_labels=True, include_type=False, shared_caches=None
+    ):
+        """
+        Extract the search spaces for the question, for a list of parameter configurations.
+        The configurations can differ in the h_* weights, k, p_setting and bm25_limit,
+        but share the depth d (and deadline_ms and lazy, if given): question words, candidates,
+        connectivity and coherence scores are computed only once, and the top-k items
+        for all configurations are computed in a single pass over the same score queues.
+        With shared caches, results are shared with other questions (see get_search_spaces).
+        Returns one result per configuration (in the same order).
+        """
         """Load parameters."""
-        h_match = parameters["h_match"]
-        h_rel = parameters["h_rel"]
-        h_conn = parameters["h_conn"]
-        h_coh = parameters["h_coh"]
-        d = int(parameters["d"])
-        k = parameters["k"]
-        p_setting = parameters["p_setting"]
-        bm25_limit = parameters["bm25_limit"]
+        parameters, d, configurations, budget, timings, lazy = self._load_parameters(parameter_list)
+
+        """ Get question words from question. """
+        start = time.time()
+        with timings.measure("question_words"):
+            question_words = self.get_question_words(question)
+        timings.count("question_words", len(question_words))
+        self._print_question_words(question, question_words, start)
+
+        """ Initialize question word top-k processors. """
+        topk_processors, connectivity_graph, coherence_graph = self._create_topk_processors(
+            question_words, parameters, d, shared_caches
+        )
+
+        """
+        Compute candidates, connectivity and coherence scores, and the top-k KB items
+        (for all configurations) as graph of tasks: each task starts once its inputs are ready.
+        """
+        start = time.time()
+        for tasks in self._get_task_phases(
+            topk_processors,
+            connectivity_graph,
+            coherence_graph,
+            configurations,
+            d,
+            budget,
+            timings,
+            lazy,
+            shared_caches,
+        ):
+            self.scheduler.run(tasks)
+        self._print_verbose(("Time for candidates, scores and top-k processors", time.time() - start))
+
+        """ Fetch best KB items and extract search space (for each configuration). """
+        return self._extract_search_spaces(
+            question,
+            question_words,
+            topk_processors,
+            parameter_list,
+            budget,
+            timings,
+            include_labels,
+            include_type,
+            shared_caches,
+        )
+
+    async def aget_search_space(self, question, parameters, include_labels=True, include_type=False):
+        """
+        Extract the search space for the question, using the given parameters (same result as get_seach_space),
+        for use within asyncio: the NER and the searches for candidates are awaited concurrently
+        (on pooled connections), and the CPU-bound stages run on the thread pool of the scheduler,
+        so that the event loop is never blocked and many requests can be served concurrently.
+        """
+        parameters, d, configurations, budget, timings, lazy = self._load_parameters([parameters])
 
         """ Get question words from question. """
         start = time.time()
-        question_words = self.string_lib.get_question_words(question, self.ner, self.nlp)
+        with timings.measure("question_words", cpu_time=False):
+            question_words = await self.aget_question_words(question)
+        timings.count("question_words", len(question_words))
+        self._print_question_words(question, question_words, start)
+
+        """ Initialize question word top-k processors, and search for all candidates concurrently. """
+        topk_processors, connectivity_graph, coherence_graph = self._create_topk_processors(
+            question_words, parameters, d, None
+        )
+        start = time.time()
+        await asyncio.gather(
+            *(self._ainitialize_candidates(topk_processor, d, budget, timings) for topk_processor in topk_processors)
+        )
+        self._print_verbose(("Time for searching candidates", time.time() - start))
+
+        """ Compute scores and the top-k KB items (candidates are already initialized). """
+        start = time.time()
+        for tasks in self._get_task_phases(
+            topk_processors,
+            connectivity_graph,
+            coherence_graph,
+            configurations,
+            d,
+            budget,
+            timings,
+            lazy,
+            None,
+            candidates_initialized=True,
+        ):
+            await self.scheduler.arun(tasks)
+        self._print_verbose(("Time for candidates, scores and top-k processors", time.time() - start))
+
+        """ Fetch best KB items and extract search space. """
+        results = await self.scheduler.arun_function(
+            functools.partial(
+                self._extract_search_spaces,
+                question,
+                question_words,
+                topk_processors,
+                [parameters],
+                budget,
+                timings,
+                include_labels,
+                include_type,
+            )
+        )
+        return results[0]
+
+    async def aget_question_words(self, question):
+        """Same as get_question_words, for use within asyncio (see StringLibrary.aget_question_words)."""
+        found, question_words = self.question_words_cache.lookup(question)
+        if not found:
+            # the NER pipeline is loaded on first use, which should not block the event loop
+            nlp = await self.scheduler.arun_function(lambda: self.nlp)
+            question_words = await self.string_lib.aget_question_words(
+                question, self.ner, nlp, executor=self.scheduler.executor
+            )
+            if question_words is None:
+                question_words = self.string_lib.get_question_words(question, None)
+            else:
+                self.question_words_cache.store(question, question_words)
+        return list(question_words)
+
+    def _load_parameters(self, parameter_list):
+        """
+        Returns the parameters of the first configuration, the shared depth d, the (hyperparameters, k)-tuples
+        of all configurations, the latency budget, the timings of the request and the lazy setting.
+        """
+        parameters = parameter_list[0]
+        d = int(parameters["d"])
+        if any(int(configuration["d"]) != d for configuration in parameter_list):
+            raise Exception("All parameter configurations need to share the same value of d!")
+        configurations = [
+            (
+                (configuration["h_match"], configuration["h_rel"], configuration["h_conn"], configuration["h_coh"]),
+                configuration["k"],
+            )
+            for configuration in parameter_list
+        ]
+        # optional latency budget (in ms)
+        budget = LatencyBudget(parameters.get("deadline_ms"))
+        # optional timings of the stages (returned in the result, and always recorded for the metrics)
+        timings = StageTimings(parameters.get("timings", False) or self.metrics is not None)
+        # lazy scoring of connectivity and coherence
+        lazy = parameters.get("lazy", False)
+        return parameters, d, configurations, budget, timings, lazy
+
+    def _print_question_words(self, question, question_words, start):
+        """Print the question words (if verbose is set)."""
         self._print_verbose(("Question: ", question))
         self._print_verbose(("Question words: ", question_words))
         self._print_verbose(("Time for question words: ", time.time() - start))
 
-        """ Initialization. """
-        itemlists = list()
-        processes = list()
+    def _create_topk_processors(self, question_words, parameters, d, shared_caches=None):
+        """Create the top-k processors of the question words, and the connectivity and coherence graphs."""
         topk_processors = list()
-
-        """ Initialize question word top-k processors. """
-        start = time.time()
-        connectivity_graph = ConnectivityGraph()
-        coherence_graph = CoherenceGraph(self.wiki2vec)
+        connectivity_graph = ConnectivityGraph(len(question_words), d)
+        coherence_graph = CoherenceGraph(len(question_words), d)
         for question_word_index, question_word in enumerate(question_words):
             topk_processor = TopkProcessor(
                 self.kb,
@@ -83,99 +405,213 @@ class CLOCQAlgorithm:
                 coherence_graph,
                 question_word_index,
                 question_words,
-                h_match=h_match,
-                h_rel=h_rel,
-                h_conn=h_conn,
-                h_coh=h_coh,
+                h_match=parameters["h_match"],
+                h_rel=parameters["h_rel"],
+                h_conn=parameters["h_conn"],
+                h_coh=parameters["h_coh"],
                 d=d,
-                k=k,
+                k=parameters["k"],
                 wikidata_search_cache=self.wikidata_search_cache,
+                search_engine=self.search_engine,
+                alias_table=self.alias_table,
+                trigram_index=self.trigram_index,
+                candidate_cache=shared_caches.candidates if shared_caches else None,
                 verbose=self.verbose,
             )
             topk_processors.append(topk_processor)
-            t = threading.Thread(target=topk_processor.add_candidates_to_graph)
-            processes.append(t)
-            t.start()
-        for process in processes:
-            process.join()
-        processes = list()
-        self._print_verbose(("Time for initializing question word processor ", time.time() - start))
+        return topk_processors, connectivity_graph, coherence_graph
 
+    def _get_task_phases(
+        self,
+        topk_processors,
+        connectivity_graph,
+        coherence_graph,
+        configurations,
+        d,
+        budget,
+        timings,
+        lazy,
+        shared_caches=None,
+        candidates_initialized=False,
+    ):
+        """
+        Yields the graphs of tasks (see TaskScheduler) for the candidates, connectivity and coherence scores,
+        and the top-k KB items. Each graph is yielded once the previous one is done.
+        If the candidates are already initialized (and measured), the candidates tasks are not measured again.
+        """
+        tasks = dict()
+        for i, topk_processor in enumerate(topk_processors):
+            initialize_candidates = functools.partial(self._initialize_candidates, topk_processor, d, budget, timings)
+            if not candidates_initialized:
+                initialize_candidates = timings.timed("candidates", initialize_candidates)
+            tasks[("candidates", i)] = (initialize_candidates, [])
+        if lazy:
+            # scores are established on demand by the top-k processors, which requires all candidates
+            # (the time for connectivity and coherence is part of the top-k stage then)
+            yield tasks
+            lazy_processor = self._get_lazy_processor(
+                topk_processors, connectivity_graph, coherence_graph, budget, timings, shared_caches
+            )
+            yield {
+                ("top_k", i): (
+                    timings.timed(
+                        "top_k", functools.partial(topk_processor.compute_top_k_lazy, configurations, lazy_processor)
+                    ),
+                    [],
+                )
+                for i, topk_processor in enumerate(topk_processors)
+            }
+            return
         """ Retrieve set of word-word pairs for coherence/connectivity computations. """
+        question_words = [topk_processor.question_word for topk_processor in topk_processors]
         question_word_pairs = self._get_question_word_pairs(question_words)
+        for index1, index2 in question_word_pairs:
+            candidates = [("candidates", index1), ("candidates", index2)]
+            tasks[("connectivity", index1, index2)] = (
+                timings.timed(
+                    "connectivity",
+                    functools.partial(
+                        self._establish_connectivity,
+                        connectivity_graph,
+                        topk_processors[index1],
+                        topk_processors[index2],
+                        budget,
+                        timings,
+                        shared_caches,
+                    ),
+                ),
+                candidates,
+            )
+            tasks[("coherence", index1, index2)] = (
+                timings.timed(
+                    "coherence",
+                    functools.partial(
+                        self._establish_coherence,
+                        coherence_graph,
+                        topk_processors[index1],
+                        topk_processors[index2],
+                        budget,
+                        timings,
+                        shared_caches,
+                    ),
+                ),
+                candidates,
+            )
+        for i, topk_processor in enumerate(topk_processors):
+            pairs = [(index1, index2) for index1, index2 in question_word_pairs if i in (index1, index2)]
+            tasks[("top_k", i)] = (
+                timings.timed(
+                    "top_k",
+                    functools.partial(
+                        topk_processor.compute_top_k_configurations,
+                        configurations,
+                        connectivity_graph,
+                        coherence_graph,
+                    ),
+                ),
+                [("candidates", i)]
+                + [("connectivity", index1, index2) for index1, index2 in pairs]
+                + [("coherence", index1, index2) for index1, index2 in pairs],
+            )
+        yield tasks
 
-        """ Establish scores in connectivity graph. """
-        start = time.time()
-        for i, question_word_pair in enumerate(question_word_pairs):
-            index1, index2 = question_word_pair
-            connectivity_processor = ConnectivityScoreProcessor(self.kb, connectivity_graph,)
-            candidates1 = topk_processors[index1].get_candidates()
-            candidates2 = topk_processors[index2].get_candidates()
-            t = threading.Thread(target=connectivity_processor.process, args=(candidates1, candidates2,),)
-            processes.append(t)
-            t.start()
-        for process in processes:
-            process.join()
-        processes = list()
-        self._print_verbose(("Time for establishing scores in connectivity graph", time.time() - start))
-
-        """ Establish scores in coherence graph. """
-        start = time.time()
-        for question_word_pair in question_word_pairs:
-            index1, index2 = question_word_pair
-            coherence_processor = CoherenceScoreProcessor(self.wiki2vec, coherence_graph,)
-            candidates1 = topk_processors[index1].get_candidates()
-            candidates2 = topk_processors[index2].get_candidates()
-            t = threading.Thread(target=coherence_processor.process, args=(candidates1, candidates2,),)
-            processes.append(t)
-            t.start()
-        for process in processes:
-            process.join()
-        self._print_verbose(("Time for establishing scores in coherence graph", time.time() - start))
-        processes = list()
-
-        """ Compute top k candidates for each of the question words. """
+    def _extract_search_spaces(
+        self,
+        question,
+        question_words,
+        topk_processors,
+        parameter_list,
+        budget,
+        timings,
+        include_labels,
+        include_type,
+        shared_caches=None,
+    ):
+        """
+        Fetch the best KB items and extract the search space (for each configuration).
+        If requested, the timings of the request are added to the results (and logged).
+        """
         start = time.time()
-        for topk_processor in topk_processors:
-            t = threading.Thread(target=topk_processor.compute_top_k, args=(connectivity_graph, coherence_graph,),)
-            processes.append(t)
-            t.start()
-        for process in processes:
-            process.join()
-        processes = list()
-        self._print_verbose(("Time for top-k processors", time.time() - start))
+        results = list()
+        counts = list()
+        with timings.measure("extraction"):
+            # neighborhoods are shared among the configurations
+            neighborhoods = dict()
+            lower_p = budget.is_tight(LOWER_P_FRACTION)
+            for configuration_index, configuration in enumerate(parameter_list):
+                kb_item_tuple = list()
+                search_space = list()
+                for j, topk_processor in enumerate(topk_processors):
+                    topklist = topk_processor.get_top_k(configuration_index)
+                    k = topk_processor.get_k(configuration_index)
+                    p = self._set_p(configuration["p_setting"], k)  # set value of p
+                    # lower the value of p if the budget gets tight
+                    if lower_p and budget.lowered_p(p) < p:
+                        p = budget.lowered_p(p)
+                        budget.degrade("lowered_p")
+                    for rank, item in enumerate(topklist):
+                        label = self.kb.item_to_single_label(item["id"])
+                        kb_item_tuple.append(
+                            {
+                                "item": {"id": item["id"], "label": label},
+                                "question_word": question_words[j],
+                                "score": item["score"],
+                                "rank": rank,
+                            }
+                        )
+                        search_space += self._get_neighborhood(
+                            item["id"], p, include_labels, include_type, neighborhoods, shared_caches
+                        )
+                retrieved_facts = len(search_space)
 
-        """ Fetch best KB items and extract search space. """
-        start = time.time()
-        kb_item_tuple = list()
-        search_space = list()
-        for j, topk_processor in enumerate(topk_processors):
-            topklist = topk_processor.get_top_k()
-            p = self._set_p(p_setting, topk_processor.k)  # set value of p
-            for rank, item in enumerate(topklist):
-                label = self.kb.item_to_single_label(item["id"])
-                kb_item_tuple.append(
-                    {
-                        "item": {"id": item["id"], "label": label},
-                        "question_word": question_words[j],
-                        "score": item["score"],
-                        "rank": rank,
-                    }
+                """ OPTIONAL: prune search space using BM25 """
+                bm25_limit = configuration["bm25_limit"]
+                if bm25_limit:
+                    with timings.measure("bm25"):
+                        search_space = self._bm25_pruning(question, search_space, bm25_limit)
+
+                """ Return the search space and disambiguation results. """
+                result = {"kb_item_tuple": kb_item_tuple, "search_space": search_space}
+                if budget.is_set():
+                    result["degradations"] = list(budget.degradations)
+                results.append(result)
+                counts.append(
+                    {"kb_items": len(kb_item_tuple), "retrieved_facts": retrieved_facts, "facts": len(search_space)}
                 )
-                search_space += self.kb.get_neighborhood(item["id"], p=p, include_labels=include_labels, include_type=include_type)
+        if timings.is_set():
+            timings_list = [timings.to_dict(**result_counts) for result_counts in counts]
+            if self.metrics is not None:
+                self._observe_metrics(timings_list)
+            if parameter_list[0].get("timings", False):
+                for result, result_timings in zip(results, timings_list):
+                    result["timings"] = result_timings
+                self._log_timings(question, timings_list)
         self._print_verbose(("Time for retrieving search space", time.time() - start))
+        return results
 
-        """ OPTIONAL: prune search space using BM25 """
-        if bm25_limit:
-            search_space = self._bm25_pruning(question, search_space, bm25_limit)
+    def _observe_metrics(self, timings_list):
+        """Add the stage timings and sizes of the request (given for each configuration) to the metrics."""
+        for stage, stage_timings in timings_list[0]["stages"].items():
+            self.metrics.observe("clocq_stage_seconds", stage_timings["wall_ms"] / 1000, stage=stage)
+        counts = timings_list[0]["counts"]
+        for count in ("question_words", "candidates", "connectivity_checks"):
+            self.metrics.observe("clocq_search_space_size", counts.get(count, 0), count=count)
+        for timings in timings_list:
+            for count in ("kb_items", "retrieved_facts", "facts"):
+                self.metrics.observe("clocq_search_space_size", timings["counts"][count], count=count)
 
-        """ Return the search space and disambiguation results. """
-        result = {"kb_item_tuple": kb_item_tuple, "search_space": search_space}
-        return result
+    def _log_timings(self, question, timings_list):
+        """Append the timings of the request (one line per configuration) to the timings log (if set)."""
+        self._print_verbose(("Timings", timings_list))
+        if not self.path_to_timings_log:
+            return
+        lines = [json.dumps({"question": question, "timings": timings}) + "\n" for timings in timings_list]
+        with self.timings_log_lock:
+            with open(self.path_to_timings_log, "a") as fp:
+                fp.writelines(lines)
 
     def store_caches(self):
         """Store caches of the individual components."""
-        self.wiki2vec.store_norm_cache()
         self.wikidata_search_cache.store_cache()
         self.string_lib.store_tagme_NER_cache()
 
@@ -212,6 +648,144 @@ class CLOCQAlgorithm:
             p_value = int(p_setting)
         return p_value
 
+    def _initialize_candidates(self, topk_processor, d, budget, timings):
+        """
+        Initialize the candidates of the question word (the depth is reduced if the budget gets tight).
+        The budget is checked before the search already, so that fewer candidates are retrieved.
+        """
+        self._reduce_depth(topk_processor, d, budget)
+        topk_processor.initialize_candidates()
+        self._reduce_depth(topk_processor, d, budget)
+        timings.count("candidates", len(topk_processor.get_candidates()))
+
+    async def _ainitialize_candidates(self, topk_processor, d, budget, timings):
+        """
+        Search for the candidates of the question word (for use within asyncio):
+        the lookups run on the thread pool of the scheduler.
+        """
+        self._reduce_depth(topk_processor, d, budget)
+        with timings.measure("candidates", cpu_time=False):
+            await topk_processor.ainitialize_candidates(self.scheduler.executor)
+
+    def _reduce_depth(self, topk_processor, d, budget):
+        """Reduce the depth of the candidate list, if the budget gets tight."""
+        if budget.is_tight(REDUCE_DEPTH_FRACTION):
+            reduced_d = budget.reduced_depth(d)
+            if reduced_d < d:
+                topk_processor.reduce_depth(reduced_d)
+                budget.degrade("reduced_d")
+
+    def _get_connectivity_depth(self, budget):
+        """Returns the number of candidates to check connectivity for (restricted if the budget gets tight)."""
+        if budget.is_tight(RESTRICT_CONNECTIVITY_FRACTION):
+            budget.degrade("restricted_connectivity")
+            return RESTRICTED_CONNECTIVITY_DEPTH
+        return None
+
+    def _establish_connectivity(
+        self, connectivity_graph, topk_processor1, topk_processor2, budget, timings, shared_caches=None
+    ):
+        """Establish the scores in the connectivity graph for the candidates of the two question words."""
+        connectivity_depth = self._get_connectivity_depth(budget)
+        index1 = topk_processor1.question_word_index
+        index2 = topk_processor2.question_word_index
+        candidates1 = topk_processor1.get_candidates()[:connectivity_depth]
+        candidates2 = topk_processor2.get_candidates()[:connectivity_depth]
+        timings.count("connectivity_pairs")
+        if self.engine:
+            number_of_checks = self.engine.process_connectivity(
+                connectivity_graph,
+                [(index1, index2, candidates1, candidates2)],
+                budget,
+                cache=shared_caches.connectivity if shared_caches else None,
+            )
+            timings.count("connectivity_checks", number_of_checks)
+        else:
+            connectivity_processor = ConnectivityScoreProcessor(
+                self.kb,
+                connectivity_graph,
+                budget=budget,
+                cache=shared_caches.connectivity if shared_caches else None,
+                timings=timings,
+            )
+            connectivity_processor.process(index1, index2, candidates1, candidates2)
+
+    def _establish_coherence(
+        self, coherence_graph, topk_processor1, topk_processor2, budget, timings, shared_caches=None
+    ):
+        """
+        Establish the scores in the coherence graph for the candidates of the two question words
+        (skipped if the budget gets tight).
+        """
+        if budget.is_tight(SKIP_COHERENCE_FRACTION):
+            budget.degrade("skipped_coherence")
+            return
+        index1 = topk_processor1.question_word_index
+        index2 = topk_processor2.question_word_index
+        candidates1 = topk_processor1.get_candidates()
+        candidates2 = topk_processor2.get_candidates()
+        timings.count("coherence_pairs")
+        if self.engine:
+            self.engine.process_coherence(
+                coherence_graph,
+                [(index1, index2, candidates1, candidates2)],
+                cache=shared_caches.embeddings if shared_caches else None,
+            )
+        else:
+            coherence_processor = CoherenceScoreProcessor(
+                self.wiki2vec, coherence_graph, embedding_cache=shared_caches.embeddings if shared_caches else None
+            )
+            coherence_processor.process(index1, index2, candidates1, candidates2)
+
+    def _get_lazy_processor(
+        self, topk_processors, connectivity_graph, coherence_graph, budget, timings, shared_caches=None
+    ):
+        """Create the processor for lazy scoring (coherence is skipped if the budget gets tight)."""
+        connectivity_depth = self._get_connectivity_depth(budget)
+        skip_coherence = budget.is_tight(SKIP_COHERENCE_FRACTION)
+        if skip_coherence:
+            budget.degrade("skipped_coherence")
+        number_of_pairs = len(topk_processors) * (len(topk_processors) - 1) // 2
+        timings.count("connectivity_pairs", number_of_pairs)
+        timings.count("coherence_pairs", 0 if skip_coherence else number_of_pairs)
+        return LazyScoreProcessor(
+            [topk_processor.get_candidates()[:] for topk_processor in topk_processors],
+            ConnectivityScoreProcessor(
+                self.kb,
+                connectivity_graph,
+                budget=budget,
+                cache=shared_caches.connectivity if shared_caches else None,
+                timings=timings,
+            ),
+            None
+            if skip_coherence
+            else CoherenceScoreProcessor(
+                self.wiki2vec, coherence_graph, embedding_cache=shared_caches.embeddings if shared_caches else None
+            ),
+            connectivity_depth=connectivity_depth,
+        )
+
+    def _get_neighborhood(self, item_id, p, include_labels, include_type, neighborhoods, shared_caches=None):
+        """
+        Retrieve the neighborhood of the KB item. Neighborhoods are shared among the
+        configurations (in the given dict), and among questions (with shared caches).
+        """
+        if neighborhoods.get((item_id, p)) is None:
+            if shared_caches is None:
+                neighborhood = self.kb.get_neighborhood(
+                    item_id, p=p, include_labels=include_labels, include_type=include_type
+                )
+            else:
+                key = (item_id, p, include_labels, include_type)
+                found, neighborhood = shared_caches.neighborhoods.lookup(key)
+                if not found:
+                    neighborhood = self.kb.get_neighborhood(
+                        item_id, p=p, include_labels=include_labels, include_type=include_type
+                    )
+                    shared_caches.neighborhoods.store(key, neighborhood)
+            neighborhoods[(item_id, p)] = neighborhood
+        return neighborhoods[(item_id, p)]
+
     def _get_question_word_pairs(self, question_words):
         """
         Returns all pairs of question words (by index). Required to
@@ -265,9 +839,7 @@ class CLOCQAlgorithm:
 
     def _tokenize(self, string):
         """Tokenize input string."""
-        string = string.replace(",", "")
-        # string = string.lower()
-        return [word for word in string.split() if not word in self.stopwords]
+        return self.tokenizer.tokenize(string)
 
 
 if __name__ == "__main__":
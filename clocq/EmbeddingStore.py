@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    Precomputed embeddings of all KB items (entities and predicates),
+    stored in a single matrix aligned to the integer encoding of the KB:
+    row i holds the unit-normalized embedding of the KB item with integer encoding i.
+    Rows of KB items without embedding are zero.
+    The matrix is memory-mapped, so embedding a KB item is a single row read.
+
+    The dtype of the matrix trades accuracy for memory: float32 (exact), float16,
+    or int8. For int8, each vector is scaled by its maximum absolute value before
+    rounding (per-vector scale). As all embeddings are unit-normalized, the scale
+    is recovered by normalizing the row on lookup and does not need to be stored.
+    """
+
+    def __init__(self, kb, path_to_embedding_store):
+        self.kb = kb
+        self.matrix = np.load(path_to_embedding_store, mmap_mode="r")
+
+    def lookup(self, kb_item):
+        """
+        Retrieve the embedding for the KB item.
+        Returns a (found, vector)-tuple: found is False if the item is not
+        covered by the store (e.g. literals or question words), vector is None
+        if the item is covered, but has no embedding.
+        """
+        integer_encoded_item = self.kb.item_to_integer(kb_item)
+        if not integer_encoded_item or integer_encoded_item < 0 or integer_encoded_item >= len(self.matrix):
+            return False, None
+        row = self.matrix[integer_encoded_item]
+        if not row.any():
+            return True, None
+        vector = np.array(row, dtype=np.float32)
+        if not self.matrix.dtype == np.float32:
+            # restore unit length of quantized vectors
+            vector /= np.linalg.norm(vector)
+        return True, vector
+
+    @staticmethod
+    def quantize(vector, dtype):
+        """Encode the (unit-normalized) vector in the given dtype."""
+        dtype = np.dtype(dtype)
+        if dtype == np.int8:
+            scale = np.abs(vector).max() / 127
+            return np.round(vector / scale).astype(np.int8)
+        return vector.astype(dtype)
+
+    @staticmethod
+    def build(kb, wiki2vec, path_to_embedding_store, dtype=np.float32, verbose=True):
+        """
+        Create the embedding store for all KB items, using the (costly) embedding
+        logic of Wikipedia2VecRelevance: the Wikipedia2Vec entity vector if available,
+        and the averaged word vectors of the KB item label otherwise.
+        The matrix is written to a temporary file first, and moved to the given path when complete.
+        """
+        start = time.time()
+        path_to_tmp_file = path_to_embedding_store + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(
+            path_to_tmp_file, mode="w+", dtype=dtype, shape=(kb.HIGHEST_ID, wiki2vec.get_dimension())
+        )
+        number_of_embeddings = 0
+        for integer_encoded_item in range(1, kb.HIGHEST_ID):
+            try:
+                kb_item = kb.integer_to_item(integer_encoded_item)
+            except IndexError:
+                # no KB item with the given integer encoding
+                continue
+            vector = wiki2vec.compute_kb_item_embedding(kb_item)
+            if vector is not None:
+                matrix[integer_encoded_item] = EmbeddingStore.quantize(vector, dtype)
+                number_of_embeddings += 1
+            if verbose and integer_encoded_item % 1000000 == 0:
+                print(f"Processed {integer_encoded_item} KB items ({time.time() - start}s)")
+        matrix.flush()
+        del matrix
+        os.replace(path_to_tmp_file, path_to_embedding_store)
+        if verbose:
+            print(f"Stored {number_of_embeddings} embeddings in {path_to_embedding_store} ({time.time() - start}s)")
+
+
+if __name__ == "__main__":
+    from clocq import config
+    from clocq.knowledge_base.KnowledgeBase import KnowledgeBase
+    from clocq.Wikipedia2VecRelevance import Wikipedia2VecRelevance
+
+    # optional: dtype of the matrix (float32, float16 or int8)
+    dtype = sys.argv[1] if len(sys.argv) > 1 else "float32"
+
+    # labels are loaded from the dictionaries: the KB index itself is not required
+    kb = KnowledgeBase(config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS, max_items=10)
+    wiki2vec = Wikipedia2VecRelevance(
+        kb, config.PATH_TO_STOPWORDS, config.PATH_TO_WIKI2VEC_MODEL, config.PATH_TO_WIKIPEDIA_MAPPINGS
+    )
+    EmbeddingStore.build(kb, wiki2vec, config.PATH_TO_EMBEDDING_STORE, dtype=np.dtype(dtype))
@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import time
+
+from clocq import config
+from clocq.CLOCQAlgorithm import CLOCQAlgorithm
+from clocq.EmbeddingStore import EmbeddingStore
+from clocq.Evaluation import Evaluation
+from clocq.knowledge_base.KnowledgeBase import KnowledgeBase
+from clocq.MemoryMappedWikipedia2Vec import MemoryMappedWikipedia2Vec
+from clocq.StringLibrary import StringLibrary
+from clocq.WikidataSearchCache import WikidataSearchCache
+
+
+def _run_benchmark(clocq, evaluation, questions, parameters):
+    """Run CLOCQ on the questions. Returns the answer presence, the timings and the disambiguations."""
+    answer_presence = list()
+    timings = list()
+    disambiguations = list()
+    for instance in questions:
+        start = time.time()
+        result = clocq.get_seach_space(instance["question"], parameters)
+        timings.append(time.time() - start)
+        evaluation_result, _ = evaluation.evaluate(result["search_space"], instance["answers"])
+        answer_presence.append(evaluation_result.hit)
+        disambiguations.append([(item["question_word"], item["item"]["id"]) for item in result["kb_item_tuple"]])
+    return answer_presence, timings, disambiguations
+
+
+def _get_wiki2vec_report(wiki2vec_model):
+    """Returns the dtype and memory of the vectors of the Wikipedia2Vec model (used for words and phrases)."""
+    if isinstance(wiki2vec_model, MemoryMappedWikipedia2Vec):
+        return str(wiki2vec_model.syn0.dtype), round(wiki2vec_model.get_size() / 1024 ** 2, 1)
+    return str(wiki2vec_model.syn0.dtype), round(wiki2vec_model.syn0.nbytes / 1024 ** 2, 1)
+
+
+def benchmark_embedding_stores(clocq, evaluation, questions, paths_to_embedding_stores, parameters=config.DEF_PARAMS):
+    """
+    Compare the given embedding stores (e.g. float32, float16 and int8) on the questions.
+    Reports the memory of the store, the answer presence, the average time per question,
+    and the agreement of the disambiguations with the first store given (the reference).
+    The word and phrase vectors are taken from the Wikipedia2Vec model in use, which is
+    reported as well: the memory of the model is only reduced with a quantized
+    memory-mappable layout (see MemoryMappedWikipedia2Vec.convert).
+    """
+    wiki2vec_dtype, wiki2vec_size_mb = _get_wiki2vec_report(clocq.wiki2vec.wiki2vec)
+    reference_disambiguations = None
+    reports = list()
+    for path_to_embedding_store in paths_to_embedding_stores:
+        embedding_store = EmbeddingStore(clocq.kb, path_to_embedding_store)
+        clocq.wiki2vec.embedding_store = embedding_store
+        answer_presence, timings, disambiguations = _run_benchmark(clocq, evaluation, questions, parameters)
+        if reference_disambiguations is None:
+            reference_disambiguations = disambiguations
+        agreement = sum(1 for d1, d2 in zip(disambiguations, reference_disambiguations) if d1 == d2)
+        report = {
+            "embedding_store": path_to_embedding_store,
+            "dtype": str(embedding_store.matrix.dtype),
+            "size_mb": round(os.path.getsize(path_to_embedding_store) / 1024 ** 2, 1),
+            "wiki2vec_dtype": wiki2vec_dtype,
+            "wiki2vec_size_mb": wiki2vec_size_mb,
+            "instances": len(questions),
+            "avg_answer_presence": round(sum(answer_presence) / len(answer_presence), 3),
+            "avg_time_consumed": round(sum(timings) / len(timings), 3),
+            "disambiguation_agreement": round(agreement / len(questions), 3),
+        }
+        print(json.dumps(report))
+        reports.append(report)
+    return reports
+
+
+if __name__ == "__main__":
+    # usage: python clocq/EmbeddingStoreBenchmark.py <reference store> <store> ... [--limit=<number of questions>]
+    #   [--wiki2vec=<directory of a memory-mappable Wikipedia2Vec layout, e.g. converted with int8 vectors>]
+    params = [param for param in sys.argv[1:] if not param.startswith("--")]
+    limit = next((int(param.split("=")[1]) for param in sys.argv[1:] if param.startswith("--limit=")), 500)
+    path_to_wiki2vec_layout = next(
+        (param.split("=", 1)[1] for param in sys.argv[1:] if param.startswith("--wiki2vec=")), None
+    )
+    if not params:
+        sys.exit(0)
+
+    string_lib = StringLibrary(config.PATH_TO_STOPWORDS, config.TAGME_TOKEN, config.PATH_TO_TAGME_NER_CACHE)
+    evaluation = Evaluation(string_lib)
+    wikidata_search_cache = WikidataSearchCache(config.PATH_TO_WIKI_SEARCH_CACHE)
+    kb = KnowledgeBase(config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS)
+    clocq = CLOCQAlgorithm(
+        kb,
+        string_lib,
+        "results/embedding_store_benchmark",
+        config.NER,
+        config.PATH_TO_STOPWORDS,
+        config.PATH_TO_WIKI2VEC_MODEL,
+        config.PATH_TO_WIKIPEDIA_MAPPINGS,
+        wikidata_search_cache=wikidata_search_cache,
+    )
+    if path_to_wiki2vec_layout:
+        clocq.wiki2vec.wiki2vec_model = MemoryMappedWikipedia2Vec(path_to_wiki2vec_layout)
+
+    # dev questions of the first benchmark
+    benchmark_file, benchmark_name = config.BENCHMARKS[0]
+    with open(benchmark_file, "r") as fp:
+        questions = json.load(fp)["dev"][:limit]
+    print("Benchmark: ", benchmark_name, "Instances: ", len(questions))
+    benchmark_embedding_stores(clocq, evaluation, questions, params)
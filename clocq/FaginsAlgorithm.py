@@ -1,147 +1,218 @@
+import heapq
+
+# names of the scores in CLOCQ (in the order of the queues)
+SCORE_NAMES = ("match", "rel", "conn", "coh")
+
+
 class FaginsAlgorithm:
     """Fagin's Algorithm (FA)."""
 
-    def __init__(self):
-        pass
+    def __init__(self, score_names=SCORE_NAMES):
+        self.score_names = score_names
 
-    def apply(self, queue1, queue2, queue3, queue4, hyperparameters, k):
+    def apply(self, queues, hyperparameters, k):
         """
         Return the top-k items in the queues, using the hyperparameters
         in the aggregation function.
 
         Inputs:
-                - queue1, queue2, queue3, queue4 of form: list of tuples: (id, score in queue).
-                - hyperparameters: list of float-numbers (4 hyperparameters)
+                - queues: list of queues, each of form: list of tuples (id, score in queue),
+                        sorted in score-descending order.
+                - hyperparameters: list of float-numbers (one weight per queue)
                 - k: int
         """
-        h1, h2, h3, h4 = hyperparameters
-        queues = [queue1, queue2, queue3, queue4]
-        length = len(queue1)
+        indexes = [_index_queue(queue) for queue in queues]
+        length = len(queues[0]) if queues else 0
         seen_ids = dict()
+        # number of (distinct) items seen in all queues
+        shared_count = 0
 
         for i in range(length):
             for j, queue in enumerate(queues):
                 item = queue[i][0]
-                score = queue[i][1]
-                self._add_item_to_seen(item, score, seen_ids, j)
-            if self._k_items_shared(seen_ids, len(queues), k):
+                if self._add_item_to_seen(item, seen_ids, j, len(queues)):
+                    shared_count += 1
+            if shared_count >= k:
                 break
-        candidates = []
-        seen_items = [item for item in seen_ids]
-
-        for item in seen_items:
-            scores = [None] * len(queues)
-            for queue_index, score in seen_ids[item]:
-                scores[queue_index] = score
-            for index in [i for i, score in enumerate(scores) if score == None]:
-                queue = queues[index]
-                scores[index] = self._random_access(queue, item)[1]
-            score = h1 * scores[0] + h2 * scores[1] + h3 * scores[2] + h4 * scores[3]
-            candidates.append(
-                {"id": item, "score": score, "match": scores[0], "rel": scores[1], "conn": scores[2], "coh": scores[3]}
-            )
+
+        candidates = list()
+        for item in seen_ids:
+            # sorted accesses were already done, random accesses use the indexes
+            scores = [index[item] for index in indexes]
+            score = aggregate_scores(scores, hyperparameters)
+            candidates.append(_scored_item(item, score, scores, self.score_names))
 
         top_candidates = sorted(candidates, key=lambda j: j["score"], reverse=True)
         top_candidates = top_candidates[:k]
         return top_candidates
 
-    def _add_item_to_seen(self, item, score, seen_ids, queue_index):
-        """Remember the item as seen."""
+    def _add_item_to_seen(self, item, seen_ids, queue_index, number_of_queues):
+        """
+        Remember the item as seen. Returns whether the item was seen in all queues for the first time
+        (items seen again in a queue are not counted twice).
+        """
         if seen_ids.get(item) is None:
-            seen_ids[item] = [(queue_index, score)]
-        else:
-            seen_ids[item].append((queue_index, score))
-
-    def _random_access(self, queue, item_id):
-        """Random access of an id in a queue."""
-        return next((x for x in queue if x[0] == item_id), None)
-
-    def _k_items_shared(self, seen_ids, queues_count, k):
-        """Returns true if k items are shared among all queues."""
-        count = 0
-        for item in seen_ids:
-            if len(seen_ids[item]) == queues_count:
-                count += 1
-                if count == k:
-                    return True
-        return False
+            seen_ids[item] = set()
+        elif queue_index in seen_ids[item]:
+            return False
+        seen_ids[item].add(queue_index)
+        return len(seen_ids[item]) == number_of_queues
 
 
 class FaginsThresholdAlgorithm:
-    """Fagin's Threshold Algorithm (TA). Slightly more efficient than FA."""
+    """
+    Fagin's Threshold Algorithm (TA). Slightly more efficient than FA.
+    Works on any number of queues: random accesses are done via hash
+    indexes that are built once per call, and the top-k items are
+    maintained in a bounded heap.
+    """
 
-    def __init__(self):
-        pass
+    def __init__(self, score_names=SCORE_NAMES):
+        self.score_names = score_names
 
-    def apply(self, queue1, queue2, queue3, queue4, hyperparameters, k):
+    def apply(self, queues, hyperparameters, k):
         """
         Return the top-k items in the queues, using the hyperparameters
         in the aggregation function.
 
         Inputs:
-                - queue1, queue2, queue3, queue4 of form: list of tuples: (id, score in queue).
-                - hyperparameters: list of float-numbers (4 hyperparameters)
+                - queues: list of queues, each of form: list of tuples (id, score in queue),
+                        sorted in score-descending order.
+                - hyperparameters: list of float-numbers (one weight per queue)
                 - k: int
         """
-        queues = [queue1, queue2, queue3, queue4]
-        length = len(queue1)
+        return self.apply_configurations(queues, [(hyperparameters, k)])[0]
+
+    def apply_configurations(self, queues, configurations):
+        """
+        Return the top-k items in the queues for each of the given
+        (hyperparameters, k)-configurations, in a single pass over the queues.
+        Each item is fully scored only once, and each configuration stops
+        consuming items as soon as its own termination criteria is met.
+        The result for each configuration is identical to a separate run.
+
+        Inputs:
+                - queues: list of queues, each of form: list of tuples (id, score in queue),
+                        sorted in score-descending order.
+                - configurations: list of (hyperparameters, k)-tuples
+        """
+        indexes = [_index_queue(queue) for queue in queues]
+        length = len(queues[0]) if queues else 0
         seen_ids = set()
-        # initialize list maintaining top items
-        top_k_items = [{"id": None, "score": 0}] * k
-        k_th_score = 0
+        # initialize heaps maintaining top items
+        top_k_heaps = [TopkHeap(k) for _, k in configurations]
+        active = list(range(len(configurations)))
 
         threshold_scores = [1] * len(queues)
         for i in range(length):
             for j, queue in enumerate(queues):
-                item_id = queue[i][0]
-                single_score = queue[i][1]
+                item_id, single_score = queue[i]
                 # update highest possible score in queue
                 threshold_scores[j] = single_score
                 # check whether item already fully scored
                 if item_id in seen_ids:
                     continue
-                # fully score item
-                scored_item = self.compute_aggregated_score(item_id, queues, hyperparameters, single_score, j)
-                aggregated_score = scored_item["score"]
                 seen_ids.add(item_id)
-                # update top-k items
-                if aggregated_score > k_th_score:
-                    top_k_items = top_k_items[:k]
-                    top_k_items.append(scored_item)
-                    top_k_items = sorted(top_k_items, key=lambda j: j["score"], reverse=True)
-            # update threshold
-            threshold = 0
-            for l in range(len(hyperparameters)):
-                threshold += threshold_scores[l] * hyperparameters[l]
-            # check termination criteria
-            k_th_score = top_k_items[k - 1]["score"]
-            if threshold <= k_th_score:
+                # fully score item
+                scores = self.random_access(indexes, item_id, single_score, j)
+                for c in active:
+                    aggregated_score = aggregate_scores(scores, configurations[c][0])
+                    top_k_heaps[c].push(aggregated_score, (item_id, scores))
+            # update thresholds and check termination criteria
+            active = [
+                c
+                for c in active
+                if aggregate_scores(threshold_scores, configurations[c][0]) > top_k_heaps[c].kth_score()
+            ]
+            if not active:
                 break
-        top_k_items = top_k_items[:k]
-        return top_k_items
+        return [self.get_top_k_items(top_k_heap) for top_k_heap in top_k_heaps]
 
-    def compute_aggregated_score(self, item_id, queues, hyperparameters, single_score, single_score_index):
-        """Score the given item wrt. all scores in the different queues.
-        -> Use random accesses in these lists."""
-        aggregated_score = 0
-        scores = list()
-        for i, queue in enumerate(queues):
-            if not i == single_score_index:
-                new_score = self.random_access(queue, item_id)[1]
-                aggregated_score += new_score * hyperparameters[i]
-                scores.append(new_score)
+    def random_access(self, indexes, item_id, single_score=None, single_score_index=None):
+        """
+        Retrieve the scores of the item in all queues, using the indexes.
+        The score in the queue the item was just seen in can be given.
+        """
+        scores = [index[item_id] for index in indexes]
+        if single_score_index is not None:
+            scores[single_score_index] = single_score
+        return scores
+
+    def get_top_k_items(self, top_k_heap):
+        """Transform the entries of the heap into the top-k items (as dicts)."""
+        top_k_items = list()
+        for score, entry in top_k_heap.sorted_entries():
+            if entry is None:
+                # placeholder: less than k items with a positive score
+                top_k_items.append({"id": None, "score": 0})
             else:
-                aggregated_score += single_score * hyperparameters[i]
-                scores.append(single_score)
-        return {
-            "id": item_id,
-            "score": aggregated_score,
-            "match": scores[0],
-            "rel": scores[1],
-            "conn": scores[2],
-            "coh": scores[3],
-        }
-
-    def random_access(self, queue, item_id):
-        """Random access of an item in a specific queue."""
-        return next((x for x in queue if x[0] == item_id), None)
+                item_id, scores = entry
+                top_k_items.append(_scored_item(item_id, score, scores, self.score_names))
+        return top_k_items
+
+
+class TopkHeap:
+    """
+    Bounded min-heap holding the k best entries seen so far.
+    The heap is initialized with k placeholders (score 0), so that only
+    entries with a positive score enter the top-k. Among entries with the
+    same score, the entry pushed first is ranked higher.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.counter = 0
+        # heap entries: (score, -insertion counter, entry)
+        self.heap = list()
+        for _ in range(k):
+            self._append(0, None)
+
+    def _append(self, score, entry):
+        """Add the entry to the heap (without checking the bound)."""
+        heapq.heappush(self.heap, (score, -self.counter, entry))
+        self.counter += 1
+
+    def push(self, score, entry):
+        """Add the entry if it improves the top-k. Returns whether it was added."""
+        if not self.k or score <= self.kth_score():
+            self.counter += 1
+            return False
+        heapq.heapreplace(self.heap, (score, -self.counter, entry))
+        self.counter += 1
+        return True
+
+    def kth_score(self):
+        """Score of the k-th best entry."""
+        if not self.heap:
+            return 0
+        return self.heap[0][0]
+
+    def sorted_entries(self):
+        """Returns the (score, entry)-pairs in score-descending order."""
+        return [(score, entry) for score, _, entry in sorted(self.heap, reverse=True)]
+
+
+def _index_queue(queue):
+    """Hash index for random accesses: item id -> score (first occurrence in the queue)."""
+    index = dict()
+    for item_id, score in queue:
+        if not item_id in index:
+            index[item_id] = score
+    return index
+
+
+def aggregate_scores(scores, hyperparameters):
+    """Weighted sum of the scores."""
+    aggregated_score = 0
+    for score, hyperparameter in zip(scores, hyperparameters):
+        aggregated_score += score * hyperparameter
+    return aggregated_score
+
+
+def _scored_item(item_id, score, scores, score_names):
+    """Create the dict for a fully scored item."""
+    scored_item = {"id": item_id, "score": score}
+    for i, score in enumerate(scores):
+        name = score_names[i] if i < len(score_names) else f"score{i}"
+        scored_item[name] = score
+    return scored_item
@@ -29,35 +29,52 @@ def _run_method(method, method_name, parameter_tuples, data_split, is_clocq=True
     # result path for disambiguations and search spaces
     result_path = method_name + ".jsonl"
 
-    # go through parameter settings
-    for parameters in parameter_tuples:
-        # go through benchmarks
-        for (benchmark_file, benchmark_name) in config.BENCHMARKS:
-            # load data
-            with open(benchmark_file, "r") as fp:
-                benchmark = json.load(fp)
-            benchmark = benchmark[data_split]
-
-            # initialize scores
-            answer_presence = list()
-            neighborhood_sizes_facts = list()
-            neighborhood_sizes_items = list()
-            all_answer_connecting_facts = list()
-            kb_item_tuples = list()
-            timings = list()
-
-            # iterate through benchmark
-            for i, instance in enumerate(benchmark):
-                question = instance["question"]
-                answers = instance["answers"]
-
-                # retrieve search space
+    # go through benchmarks
+    for (benchmark_file, benchmark_name) in config.BENCHMARKS:
+        # load data
+        with open(benchmark_file, "r") as fp:
+            benchmark = json.load(fp)
+        benchmark = benchmark[data_split]
+        # extract question words for all questions in batches
+        if is_clocq:
+            method.precompute_question_words(
+                [instance["question"] for instance in benchmark],
+                batch_size=config.NER_BATCH_SIZE,
+                n_process=config.NER_PROCESSES,
+            )
+
+        # initialize scores (for each parameter setting)
+        answer_presence = [list() for _ in parameter_tuples]
+        neighborhood_sizes_facts = [list() for _ in parameter_tuples]
+        neighborhood_sizes_items = [list() for _ in parameter_tuples]
+        all_answer_connecting_facts = [list() for _ in parameter_tuples]
+        kb_item_tuples = [list() for _ in parameter_tuples]
+        timings = [list() for _ in parameter_tuples]
+
+        # iterate through benchmark
+        for i, instance in enumerate(benchmark):
+            question = instance["question"]
+            answers = instance["answers"]
+
+            # retrieve search spaces for all parameter settings:
+            # settings that share d are computed in a single pass
+            question_results = [None] * len(parameter_tuples)
+            question_timings = [None] * len(parameter_tuples)
+            for group in _group_parameters(parameter_tuples, is_clocq):
                 question_start = time.time()
-                result = method.get_seach_space(question, parameters)
+                if len(group) > 1:
+                    group_results = method.get_search_space_configurations(
+                        question, [parameter_tuples[j] for j in group]
+                    )
+                else:
+                    group_results = [method.get_seach_space(question, parameter_tuples[group[0]])]
                 timing = time.time() - question_start
-                answer_connecting_facts = list()
-                question_context_tuples = list()
+                for j, result in zip(group, group_results):
+                    question_results[j] = result
+                    question_timings[j] = timing
 
+            for j, parameters in enumerate(parameter_tuples):
+                result = question_results[j]
                 # iterate through contexts and accumulate result
                 kb_item_tuple = result["kb_item_tuple"]
                 search_space = result["search_space"]
@@ -65,6 +82,7 @@ def _run_method(method, method_name, parameter_tuples, data_split, is_clocq=True
 
                 # store search space and disambiguations to disk
                 if store_jsonl:
+                    instance["parameters"] = parameters
                     instance["kb_item_tuple"] = kb_item_tuple
                     instance["search_space"] = search_space
                     with open(result_path, "a") as fp:
@@ -72,40 +90,41 @@ def _run_method(method, method_name, parameter_tuples, data_split, is_clocq=True
                         fp.write("\n")
 
                 # remember results
-                kb_item_tuples.append(kb_item_tuple)
-                answer_presence.append(result.hit)
-                neighborhood_sizes_facts.append(result.neighbordhood_size_facts)
-                neighborhood_sizes_items.append(result.neighbordhood_size_items)
-                all_answer_connecting_facts.append(answer_connecting_facts)
-                timings.append(timing)
+                kb_item_tuples[j].append(kb_item_tuple)
+                answer_presence[j].append(result.hit)
+                neighborhood_sizes_facts[j].append(result.neighbordhood_size_facts)
+                neighborhood_sizes_items[j].append(result.neighbordhood_size_items)
+                all_answer_connecting_facts[j].append(answer_connecting_facts)
+                timings[j].append(question_timings[j])
 
                 # print results
-                method.print_results((question, method_name, i + 1, sum(answer_presence) / (i + 1)))
+                method.print_results((question, method_name, i + 1, sum(answer_presence[j]) / (i + 1)))
 
+        for j, parameters in enumerate(parameter_tuples):
             # create result
             avg_neighborhood_sizes_facts = (
-                f"{round(sum(neighborhood_sizes_facts)/len(neighborhood_sizes_facts), -2)/1000}k"
+                f"{round(sum(neighborhood_sizes_facts[j])/len(neighborhood_sizes_facts[j]), -2)/1000}k"
             )
             avg_neighborhood_sizes_items = (
-                f"{round(sum(neighborhood_sizes_items)/len(neighborhood_sizes_items), -2)/1000}k"
+                f"{round(sum(neighborhood_sizes_items[j])/len(neighborhood_sizes_items[j]), -2)/1000}k"
             )
-            avg_answer_presence = round(sum(answer_presence) / len(answer_presence), 3)
+            avg_answer_presence = round(sum(answer_presence[j]) / len(answer_presence[j]), 3)
             result = {
                 "method_name": method_name,
                 "NER_method": str(config.NER),
                 "parameters": parameters,
                 "data_split": data_split,
                 "instances": len(benchmark),
-                # 'neighborhood_sizes_facts': neighborhood_sizes_facts,
-                # 'neighborhood_sizes_items': neighborhood_sizes_items,
+                # 'neighborhood_sizes_facts': neighborhood_sizes_facts[j],
+                # 'neighborhood_sizes_items': neighborhood_sizes_items[j],
                 "avg_neighborhood_sizes_facts": avg_neighborhood_sizes_facts,
                 "avg_neighborhood_sizes_items": avg_neighborhood_sizes_items,
-                # "kb_item_tuples": kb_item_tuples,
-                # 'timings': timings,
-                "avg_time_consumed": round(sum(timings) / len(timings), 2),
-                "answer_presence": answer_presence,
+                # "kb_item_tuples": kb_item_tuples[j],
+                # 'timings': timings[j],
+                "avg_time_consumed": round(sum(timings[j]) / len(timings[j]), 2),
+                "answer_presence": answer_presence[j],
                 "avg_answer_presence": avg_answer_presence
-                # 'answer_connecting_facts': all_answer_connecting_facts,
+                # 'answer_connecting_facts': all_answer_connecting_facts[j],
             }
 
             # append results
@@ -126,6 +145,27 @@ def _run_method(method, method_name, parameter_tuples, data_split, is_clocq=True
         method.store_caches()
 
 
+def _group_parameters(parameter_tuples, is_clocq=True):
+    """
+    Group the indexes of the parameter settings that can be computed in a single pass
+    (i.e. settings that share the values of d, deadline_ms, lazy and timings). Other methods are run for each setting.
+    """
+    if not is_clocq:
+        return [[j] for j in range(len(parameter_tuples))]
+    groups = dict()
+    for j, parameters in enumerate(parameter_tuples):
+        key = (
+            int(parameters["d"]),
+            parameters.get("deadline_ms"),
+            parameters.get("lazy", False),
+            parameters.get("timings", False),
+        )
+        if groups.get(key) is None:
+            groups[key] = list()
+        groups[key].append(j)
+    return list(groups.values())
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         sys.exit(0)
@@ -167,7 +207,13 @@ if __name__ == "__main__":
         config.PATH_TO_STOPWORDS,
         config.PATH_TO_WIKI2VEC_MODEL,
         config.PATH_TO_WIKIPEDIA_MAPPINGS,
-        config.PATH_TO_NORM_CACHE,
         wikidata_search_cache=wikidata_search_cache,
+        path_to_embedding_store=config.PATH_TO_EMBEDDING_STORE,
+        path_to_local_search_index=config.PATH_TO_LOCAL_SEARCH_INDEX,
+        path_to_alias_table=config.PATH_TO_ALIAS_TABLE,
+        path_to_trigram_index=config.PATH_TO_TRIGRAM_INDEX,
+        wikidata_search_url=config.WIKIDATA_SEARCH_URL,
+        number_of_processes=config.NUMBER_OF_PROCESSES,
+        path_to_timings_log=config.PATH_TO_TIMINGS_LOG,
     )
     _run_method(clocq, method_name, config.CLOCQ_PARAMS, data_split, is_clocq=True)
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe cache: once maxsize entries are stored,
+    the least recently used entry is dropped. Keeps hit/miss statistics.
+    Values can be None (e.g. phrases without embedding), so lookups
+    return a (found, value)-tuple.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Retrieve the value for the key. Returns a (found, value)-tuple."""
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return True, self.cache[key]
+            self.misses += 1
+            return False, None
+
+    def __contains__(self, key):
+        """Check whether there is an entry for the key (without affecting recency or statistics)."""
+        with self.lock:
+            return key in self.cache
+
+    def store(self, key, value):
+        """Store the value for the key, dropping the least recently used entry if required."""
+        if not self.maxsize:
+            return
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def get_statistics(self):
+        """Returns the hits, misses, hit ratio and size of the cache."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0,
+                "size": len(self.cache),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        """Remove all entries (statistics are kept)."""
+        with self.lock:
+            self.cache.clear()
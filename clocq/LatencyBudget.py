@@ -0,0 +1,73 @@
+import threading
+import time
+
+# fractions of the budget that need to remain to avoid the respective degradation
+REDUCE_DEPTH_FRACTION = 0.6
+RESTRICT_CONNECTIVITY_FRACTION = 0.5
+SKIP_COHERENCE_FRACTION = 0.3
+LOWER_P_FRACTION = 0.15
+
+# values used in the degraded settings
+REDUCED_DEPTH_FACTOR = 0.5
+MIN_REDUCED_DEPTH = 5
+RESTRICTED_CONNECTIVITY_DEPTH = 5
+LOWERED_P_FACTOR = 0.1
+MIN_LOWERED_P = 10
+
+
+class LatencyBudget:
+    """
+    Keeps track of the time budget (deadline) of a single search space request.
+    The pipeline consults the budget between (and within) the individual stages,
+    and degrades gracefully once the remaining budget gets tight.
+    All degradations applied are remembered, to be reported in the result.
+    """
+
+    def __init__(self, deadline_ms=None):
+        self.deadline_ms = deadline_ms
+        self.start = time.time()
+        self.degradations = list()
+        self.lock = threading.Lock()
+
+    def is_set(self):
+        """Returns whether a deadline is given at all."""
+        return bool(self.deadline_ms)
+
+    def elapsed_ms(self):
+        """Time passed since the request started (in ms)."""
+        return (time.time() - self.start) * 1000
+
+    def remaining_ms(self):
+        """Time left until the deadline is reached (in ms)."""
+        if not self.is_set():
+            return float("inf")
+        return self.deadline_ms - self.elapsed_ms()
+
+    def remaining_fraction(self):
+        """Fraction of the budget that is left."""
+        if not self.is_set():
+            return 1.0
+        return max(self.remaining_ms(), 0) / self.deadline_ms
+
+    def is_tight(self, fraction):
+        """Returns whether less than the given fraction of the budget is left."""
+        return self.remaining_fraction() < fraction
+
+    def is_exceeded(self):
+        """Returns whether the deadline is already reached."""
+        return self.remaining_ms() <= 0
+
+    def degrade(self, degradation):
+        """Remember that the given degradation was applied."""
+        self.lock.acquire()
+        if not degradation in self.degradations:
+            self.degradations.append(degradation)
+        self.lock.release()
+
+    def reduced_depth(self, d):
+        """Depth d of candidate lists in the degraded setting."""
+        return min(d, max(MIN_REDUCED_DEPTH, int(d * REDUCED_DEPTH_FACTOR)))
+
+    def lowered_p(self, p):
+        """Pruning threshold p in the degraded setting."""
+        return min(p, max(MIN_LOWERED_P, int(p * LOWERED_P_FACTOR)))
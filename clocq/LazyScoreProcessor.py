@@ -0,0 +1,51 @@
+class LazyScoreProcessor:
+    """
+    Establishes connectivity and coherence scores on demand:
+    the scores of a candidate KB item are computed only when requested by
+    the top-k processor of its question word, i.e. when the candidate
+    can still reach the top-k threshold. Pairs scored once are shared
+    among all question words (via the masks in the graphs).
+    """
+
+    def __init__(self, candidates, connectivity_processor, coherence_processor=None, connectivity_depth=None):
+        # candidates for each question word (in list order)
+        self.candidates = candidates
+        self.connectivity_processor = connectivity_processor
+        # coherence is not scored if no processor is given
+        self.coherence_processor = coherence_processor
+        # connectivity is only scored among the top candidates (if given)
+        self.connectivity_depth = connectivity_depth
+
+    def get_upper_bounds(self, question_word_index, position):
+        """
+        Returns upper bounds for the connectivity and coherence scores of the candidate
+        KB item at the given position, before these scores are established.
+        """
+        connectivity_upper_bound = 1
+        if self.connectivity_depth is not None and position >= self.connectivity_depth:
+            connectivity_upper_bound = 0
+        coherence_upper_bound = 1 if self.coherence_processor else 0
+        return connectivity_upper_bound, coherence_upper_bound
+
+    def process_candidate(self, question_word_index, position):
+        """
+        Establish the connectivity and coherence scores among the candidate KB item
+        at the given position and the candidates of all other question words.
+        """
+        item = self.candidates[question_word_index][position]
+        for index2, candidates2 in enumerate(self.candidates):
+            if index2 == question_word_index:
+                continue
+            if self.connectivity_depth is None:
+                self.connectivity_processor.process_row(question_word_index, position, item, index2, candidates2)
+            elif position < self.connectivity_depth:
+                self.connectivity_processor.process_row(
+                    question_word_index, position, item, index2, candidates2[: self.connectivity_depth]
+                )
+            if self.coherence_processor:
+                self.coherence_processor.process_row(question_word_index, position, item, index2, candidates2)
+
+    def process_all(self, question_word_index):
+        """Establish the connectivity and coherence scores for all candidates of the question word."""
+        for position in range(len(self.candidates[question_word_index])):
+            self.process_candidate(question_word_index, position)
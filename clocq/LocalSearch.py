@@ -0,0 +1,127 @@
+import asyncio
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from clocq.PostingsIndex import PostingsIndex
+
+# weight of the popularity prior (log10 of the KB frequency) relative to the BM25 score
+POPULARITY_WEIGHT = 0.5
+# only the best postings of each token are considered (frequent tokens like "national" have millions)
+MAX_POSTINGS_PER_TOKEN = 100000
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(string):
+    """Lowercase the string and split it into alphanumeric tokens."""
+    return TOKEN_PATTERN.findall(string.lower())
+
+
+def iterate_kb_item_names(kb):
+    """
+    Iterate through all KB items (entities and predicates).
+    Yields (integer encoding, KB item, names)-tuples, with names
+    being the labels and aliases of the KB item.
+    """
+    for integer_encoded_item in range(1, kb.HIGHEST_ID):
+        try:
+            kb_item = kb.integer_to_item(integer_encoded_item)
+        except IndexError:
+            # no KB item with the given integer encoding
+            continue
+        names = list()
+        for name in kb.item_to_labels(kb_item) + kb.item_to_aliases(kb_item):
+            # the KB item id is returned if there are no labels/aliases
+            if name and not name == kb_item and not name in names:
+                names.append(name)
+        yield integer_encoded_item, kb_item, names
+
+
+class LocalSearch:
+    """
+    Local search engine for KB items, which can be used instead of the Wikidata search:
+    BM25 over the labels and aliases of the KB items, plus a popularity prior
+    based on the frequency of the KB items. The index is stored in memory-mappable
+    files (see PostingsIndex), and searches run in-process, without network access.
+    Same interface as WikidataSearch.
+    """
+
+    def __init__(self, kb, path_to_local_search_index, results_per_search=20):
+        self.kb = kb
+        self.results_per_search = results_per_search
+        self.index = PostingsIndex(path_to_local_search_index)
+        self.priors = np.load(os.path.join(path_to_local_search_index, "priors.npy"), mmap_mode="r")
+
+    def search_term(self, term, number_of_results=None):
+        """Search for the given term. Returns the KB items, sorted by score (descending)."""
+        if number_of_results is None:
+            number_of_results = self.results_per_search
+        document_ids = list()
+        weights = list()
+        for token in tokenize(term):
+            token_document_ids, token_weights = self.index.get_postings(token, limit=MAX_POSTINGS_PER_TOKEN)
+            document_ids.append(token_document_ids)
+            weights.append(token_weights)
+        if not document_ids:
+            return []
+        document_ids = np.concatenate(document_ids)
+        if not len(document_ids):
+            return []
+        # aggregate the BM25 scores of the tokens
+        document_ids, inverse = np.unique(document_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        scores += POPULARITY_WEIGHT * self.priors[document_ids]
+        # top results (ties are resolved by the integer encoding)
+        if len(scores) > number_of_results:
+            top = np.argpartition(-scores, number_of_results - 1)[:number_of_results]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.lexsort((document_ids[top], -scores[top]))]
+        return [self.kb.integer_to_item(int(document_id)) for document_id in document_ids[top]]
+
+    async def asearch_term(self, term, number_of_results=None, executor=None):
+        """
+        Search for the given term (for use within asyncio): the search runs in the executor
+        (the default executor if None).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.search_term, term, number_of_results)
+
+    @staticmethod
+    def build(kb, path_to_local_search_index, verbose=True):
+        """
+        Create the local search index over the labels and aliases of all KB items,
+        and the popularity priors (log10 of the KB frequency).
+        """
+        start = time.time()
+
+        def get_documents():
+            for integer_encoded_item, _, names in iterate_kb_item_names(kb):
+                tokens = [token for name in names for token in tokenize(name)]
+                if tokens:
+                    yield integer_encoded_item, tokens
+
+        PostingsIndex.build(get_documents, path_to_local_search_index, bm25=True)
+        if verbose:
+            print(f"Postings index created ({time.time() - start}s)")
+
+        priors = np.zeros(kb.HIGHEST_ID, dtype=np.float32)
+        for integer_encoded_item, kb_item, _ in iterate_kb_item_names(kb):
+            priors[integer_encoded_item] = np.log10(1 + sum(kb.get_frequency(kb_item)))
+        np.save(os.path.join(path_to_local_search_index, "priors.npy"), priors)
+        if verbose:
+            print(f"Local search index stored in {path_to_local_search_index} ({time.time() - start}s)")
+
+
+if __name__ == "__main__":
+    from clocq import config
+    from clocq.knowledge_base.KnowledgeBase import KnowledgeBase
+
+    # the full KB is required for the popularity priors
+    kb = KnowledgeBase(config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS)
+    path_to_local_search_index = sys.argv[1] if len(sys.argv) > 1 else config.PATH_TO_LOCAL_SEARCH_INDEX
+    LocalSearch.build(kb, path_to_local_search_index)
@@ -0,0 +1,155 @@
+import json
+import os
+import sys
+import time
+
+import marisa_trie
+import numpy as np
+
+# version of the layout (stored in meta.json)
+LAYOUT_VERSION = 1
+
+
+class MemoryMappedWikipedia2Vec:
+    """
+    Wikipedia2Vec model in a memory-mappable layout: the vectors are stored
+    as .npy matrix, the word, entity and redirect dictionaries as marisa tries
+    (as used within Wikipedia2Vec). All files are memory-mapped, so opening
+    the model is cheap, and processes on the same host share the pages.
+    Implements the part of the Wikipedia2Vec interface used by CLOCQ.
+
+    The vectors can be stored as float32 (exact), float16 or int8 (see convert), which
+    reduces the memory of the model (that is mapped by each process) by a factor of 2 or 4.
+    For int8, each vector is scaled by its maximum absolute value before rounding, and the
+    per-vector scales are stored as well (word vectors are not unit-normalized).
+    Vectors are returned as float32.
+    """
+
+    def __init__(self, path_to_directory):
+        self.word_dict = marisa_trie.Trie().mmap(os.path.join(path_to_directory, "words.marisa"))
+        self.entity_dict = marisa_trie.Trie().mmap(os.path.join(path_to_directory, "entities.marisa"))
+        self.redirect_dict = marisa_trie.RecordTrie("<I").mmap(os.path.join(path_to_directory, "redirects.marisa"))
+        self.syn0 = np.load(os.path.join(path_to_directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path_to_directory, "meta.json"), "r") as fp:
+            self.meta = json.load(fp)
+        path_to_scales = os.path.join(path_to_directory, "scales.npy")
+        self.scales = np.load(path_to_scales, mmap_mode="r") if os.path.exists(path_to_scales) else None
+        # entity vectors are stored after the word vectors
+        self.entity_offset = len(self.word_dict)
+        self._validate(path_to_directory)
+
+    def _validate(self, path_to_directory):
+        """Check that the files of the layout match (e.g. not built with a different version or model)."""
+        if self.meta.get("version", LAYOUT_VERSION) != LAYOUT_VERSION:
+            raise Exception(
+                f"Layout version {self.meta.get('version')} of {path_to_directory} is not supported "
+                f"(version {LAYOUT_VERSION} required): please convert the model again."
+            )
+        number_of_vectors = len(self.word_dict) + len(self.entity_dict)
+        if self.syn0.ndim != 2 or self.syn0.shape != (number_of_vectors, self.meta["dim"]):
+            raise Exception(
+                f"Vectors of {path_to_directory} do not match the layout (shape {self.syn0.shape}, "
+                f"expected ({number_of_vectors}, {self.meta['dim']})): please convert the model again."
+            )
+        dtype = np.dtype(self.meta.get("dtype", "float32"))
+        quantized = dtype == np.int8
+        if self.syn0.dtype != dtype or quantized != (self.scales is not None):
+            raise Exception(
+                f"Vectors of {path_to_directory} do not match the dtype {dtype}: please convert the model again."
+            )
+        if quantized and self.scales.shape != (number_of_vectors,):
+            raise Exception(f"Scales of {path_to_directory} do not match the vectors: please convert the model again.")
+
+    def get_word_vector(self, word):
+        """Retrieve the vector for the word. Raises a KeyError if the word is unknown."""
+        return self._get_vector(self.word_dict[word])
+
+    def get_entity_vector(self, title):
+        """
+        Retrieve the vector for the Wikipedia entity (redirects are resolved).
+        Raises a KeyError if the entity is unknown.
+        """
+        try:
+            index = self.redirect_dict[title][0][0]
+        except KeyError:
+            index = self.entity_dict[title]
+        return self._get_vector(index + self.entity_offset)
+
+    def _get_vector(self, index):
+        """Retrieve the vector at the given index (as float32)."""
+        vector = self.syn0[index]
+        if self.scales is not None:
+            return vector.astype(np.float32) * self.scales[index]
+        if not vector.dtype == np.float32:
+            return vector.astype(np.float32)
+        return vector
+
+    def get_size(self):
+        """Returns the size of the vectors (in bytes), which dominates the memory of the model."""
+        size = self.syn0.nbytes
+        if self.scales is not None:
+            size += self.scales.nbytes
+        return size
+
+    @staticmethod
+    def get_directory(path_to_wiki2vec_model):
+        """Returns the directory for the memory-mappable layout of the given Wikipedia2Vec model."""
+        return os.path.splitext(path_to_wiki2vec_model)[0] + "_mmap"
+
+    @staticmethod
+    def convert(path_to_wiki2vec_model, path_to_directory=None, dtype=np.float32):
+        """
+        Convert the Wikipedia2Vec model (.pkl) into the memory-mappable layout,
+        with the vectors stored in the given dtype (float32, float16 or int8).
+        Only required once: the files are written to a temporary directory first,
+        which is moved to the final directory when complete.
+        """
+        from wikipedia2vec import Wikipedia2Vec
+
+        start = time.time()
+        if path_to_directory is None:
+            path_to_directory = MemoryMappedWikipedia2Vec.get_directory(path_to_wiki2vec_model)
+        path_to_tmp_directory = path_to_directory + ".tmp"
+        os.makedirs(path_to_tmp_directory, exist_ok=True)
+
+        wiki2vec = Wikipedia2Vec.load(path_to_wiki2vec_model)
+        dictionary = wiki2vec.dictionary.serialize()
+        for key, file_name in [
+            ("word_dict", "words.marisa"),
+            ("entity_dict", "entities.marisa"),
+            ("redirect_dict", "redirects.marisa"),
+        ]:
+            with open(os.path.join(path_to_tmp_directory, file_name), "wb") as fp:
+                fp.write(dictionary[key])
+        dtype = np.dtype(dtype)
+        vectors = np.asarray(wiki2vec.syn0, dtype=np.float32)
+        if dtype == np.int8:
+            # per-vector scales (zero vectors keep a scale of 1)
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            np.save(os.path.join(path_to_tmp_directory, "scales.npy"), scales.astype(np.float32))
+            vectors = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+        np.save(os.path.join(path_to_tmp_directory, "vectors.npy"), vectors.astype(dtype))
+        with open(os.path.join(path_to_tmp_directory, "meta.json"), "w") as fp:
+            json.dump(
+                {
+                    "version": LAYOUT_VERSION,
+                    "model": os.path.basename(path_to_wiki2vec_model),
+                    "dim": wiki2vec.syn0.shape[1],
+                    "number_of_vectors": wiki2vec.syn0.shape[0],
+                    "dtype": str(dtype),
+                },
+                fp,
+            )
+
+        os.replace(path_to_tmp_directory, path_to_directory)
+        print(f"Converted {path_to_wiki2vec_model} to {path_to_directory} ({time.time() - start}s)")
+
+
+if __name__ == "__main__":
+    from clocq import config
+
+    # optional: path to the Wikipedia2Vec model, and dtype of the vectors (float32, float16 or int8)
+    path_to_wiki2vec_model = sys.argv[1] if len(sys.argv) > 1 else config.PATH_TO_WIKI2VEC_MODEL
+    dtype = sys.argv[2] if len(sys.argv) > 2 else "float32"
+    MemoryMappedWikipedia2Vec.convert(path_to_wiki2vec_model, dtype=np.dtype(dtype))
@@ -0,0 +1,129 @@
+import bisect
+import os
+import resource
+import sys
+import threading
+
+# upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def get_resident_memory():
+    """Returns the resident memory of the process (in bytes). The peak is returned on systems without /proc."""
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is given in bytes on macOS, in kilobytes otherwise
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and histograms (with labels), exported
+    in the Prometheus text format (see render). Counters and gauges can also be given
+    as functions, which are evaluated on export (e.g. for the statistics of caches):
+    these return a list of (labels, value)-tuples.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> (type, help, buckets, function)
+        self.metrics = dict()
+        # name -> labels (as sorted tuple) -> value (counters, gauges), or [bucket counts, sum, count] (histograms)
+        self.values = dict()
+
+    def counter(self, name, help, function=None):
+        """Register a counter."""
+        self._register(name, "counter", help, None, function)
+
+    def gauge(self, name, help, function=None):
+        """Register a gauge."""
+        self._register(name, "gauge", help, None, function)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        """Register a histogram with the given (upper bounds of the) buckets."""
+        self._register(name, "histogram", help, tuple(sorted(buckets)), None)
+
+    def _register(self, name, metric_type, help, buckets, function):
+        with self.lock:
+            if name in self.metrics:
+                raise Exception(f"Metric {name} is already registered!")
+            self.metrics[name] = (metric_type, help, buckets, function)
+            self.values[name] = dict()
+
+    def increment(self, name, value=1, **labels):
+        """Increase the counter (or gauge) by the value."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.values[name]
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set the gauge to the value."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = value
+
+    def observe(self, name, value, **labels):
+        """Add the value to the histogram."""
+        key = tuple(sorted(labels.items()))
+        buckets = self.metrics[name][2]
+        with self.lock:
+            values = self.values[name]
+            if not key in values:
+                values[key] = [[0] * len(buckets), 0, 0]
+            histogram = values[key]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        # copy the values, so that the functions are evaluated (and the lines formatted) without the lock
+        with self.lock:
+            metrics = list(self.metrics.items())
+            values = dict()
+            for name, (metric_type, _, _, _) in metrics:
+                if metric_type == "histogram":
+                    values[name] = {
+                        key: (list(bucket_counts), total, count)
+                        for key, (bucket_counts, total, count) in self.values[name].items()
+                    }
+                else:
+                    values[name] = dict(self.values[name])
+        lines = list()
+        for name, (metric_type, help, buckets, function) in metrics:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if function is not None:
+                for labels, value in function():
+                    lines.append(f"{name}{self._format_labels(tuple(sorted(labels.items())))} {float(value)}")
+            elif metric_type == "histogram":
+                for key, (bucket_counts, total, count) in values[name].items():
+                    cumulative_count = 0
+                    for bucket, bucket_count in zip(buckets, bucket_counts):
+                        cumulative_count += bucket_count
+                        labels = self._format_labels(key + (("le", str(float(bucket))),))
+                        lines.append(f"{name}_bucket{labels} {cumulative_count}")
+                    lines.append(f"{name}_bucket{self._format_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {float(total)}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {count}")
+            else:
+                for key, value in values[name].items():
+                    lines.append(f"{name}{self._format_labels(key)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_labels(key):
+        """Format the labels (given as tuple of (label, value)-pairs)."""
+        if not key:
+            return ""
+        escaped = (
+            (label, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for label, value in key
+        )
+        return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from clocq.LRUCache import LRUCache
+
+# fraction of the entries dropped at once when the cache exceeds its maximum size
+EVICTION_FRACTION = 0.1
+# number of recently used entries kept in memory (in front of the database)
+MEMORY_CACHE_SIZE = 10000
+
+
+class PersistentCache:
+    """
+    Thread-safe key-value cache on disk (SQLite in WAL mode): values are stored as JSON,
+    entries are written incrementally (one transaction per entry), so the cache survives
+    crashes and restarts without rewriting full files. If max_entries is set, the least
+    recently written entries are dropped once the cache gets larger.
+    Without a path, the cache is kept in memory only. The database is opened on first use,
+    so that no connection is inherited by forked processes (see ProcessPoolEngine).
+    Recently used entries are also kept in a bounded in-memory LRUCache, so that most
+    hits require neither the lock of the database nor a query.
+    """
+
+    def __init__(self, path_to_cache=None, max_entries=None, memory_cache_size=MEMORY_CACHE_SIZE):
+        self.path_to_cache = path_to_cache
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.memory_cache = LRUCache(memory_cache_size)
+        # hits and misses in the database (hits in memory are counted by the memory cache)
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        self.size = 0
+
+    def _connect(self):
+        """Open the database, if not done yet (the caller holds the lock)."""
+        if self.connection is not None:
+            return
+        if self.path_to_cache:
+            directory = os.path.dirname(self.path_to_cache)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path_to_cache, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        else:
+            self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        # the rowid increases with each write (INSERT OR REPLACE), and identifies the oldest entries
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key):
+        """Retrieve the value for the key. Returns None if there is no entry."""
+        found, value = self.memory_cache.lookup(key)
+        if found:
+            return value
+        with self.lock:
+            self._connect()
+            row = self.connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        value = json.loads(row[0])
+        self.memory_cache.store(key, value)
+        return value
+
+    def store(self, key, value):
+        """Store the value for the key (replacing existing entries)."""
+        serialized_value = json.dumps(value)
+        with self.lock:
+            self._connect()
+            exists = self.connection.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, serialized_value))
+            if not exists:
+                self.size += 1
+            if self.max_entries and self.size > self.max_entries:
+                self._evict()
+            self.connection.commit()
+        self.memory_cache.store(key, value)
+
+    def _evict(self):
+        """
+        Drop the least recently written entries (the caller holds the lock).
+        Entries still used recently remain in memory.
+        """
+        number_of_entries = self.size - self.max_entries + int(EVICTION_FRACTION * self.max_entries)
+        self.connection.execute(
+            "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY rowid LIMIT ?)", (number_of_entries,)
+        )
+        self.size = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def __len__(self):
+        with self.lock:
+            self._connect()
+            return self.size
+
+    def get_statistics(self):
+        """Returns the hits, misses, hit ratio and size of the cache (same as LRUCache)."""
+        with self.lock:
+            self._connect()
+            hits = self.hits + self.memory_cache.hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0,
+                "size": self.size,
+                "maxsize": self.max_entries,
+            }
+
+    def flush(self):
+        """Move the written entries from the write-ahead log into the database file."""
+        if self.path_to_cache:
+            with self.lock:
+                if self.connection is not None:
+                    self.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def compact(self):
+        """Reclaim the space of dropped or replaced entries."""
+        with self.lock:
+            self._connect()
+            if self.path_to_cache:
+                self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.connection.execute("VACUUM")
+
+    def import_json(self, path_to_json_cache):
+        """Import the entries of a cache stored as JSON dict (as used by previous versions)."""
+        with open(path_to_json_cache, "r") as fp:
+            entries = json.load(fp)
+        with self.lock:
+            self._connect()
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                ((key, json.dumps(value)) for key, value in entries.items()),
+            )
+            self.connection.commit()
+            self.size = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        # imported entries replace the ones kept in memory
+        self.memory_cache.clear()
+
+    def close(self):
+        """Close the connection to the database."""
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    @staticmethod
+    def open(path_to_cache, max_entries=None):
+        """
+        Open the cache at the given path. If there is no cache yet, but a JSON cache
+        with the same name (e.g. wikidata_search_cache.json), its entries are imported once.
+        """
+        path_to_json_cache = os.path.splitext(path_to_cache)[0] + ".json" if path_to_cache else None
+        migrate = (
+            path_to_json_cache
+            and not path_to_json_cache == path_to_cache
+            and not os.path.exists(path_to_cache)
+            and os.path.exists(path_to_json_cache)
+        )
+        cache = PersistentCache(path_to_cache, max_entries=max_entries)
+        if migrate:
+            cache.import_json(path_to_json_cache)
+        return cache
+
+
+if __name__ == "__main__":
+    from clocq import config
+
+    # compact the given caches (the caches in the config by default)
+    paths = sys.argv[1:] if len(sys.argv) > 1 else [config.PATH_TO_WIKI_SEARCH_CACHE, config.PATH_TO_TAGME_NER_CACHE]
+    for path in paths:
+        if not path:
+            continue
+        start = time.time()
+        cache = PersistentCache.open(path)
+        cache.compact()
+        print(f"Compacted {path}: {len(cache)} entries ({time.time() - start}s)")
+        cache.close()
@@ -0,0 +1,130 @@
+import json
+import os
+from collections import Counter
+
+import marisa_trie
+import numpy as np
+
+
+class PostingsIndex:
+    """
+    Inverted index: key (e.g. token) -> postings of (document id, weight).
+    The keys are stored in a marisa trie (the key id identifies the postings),
+    the postings in flat arrays: the postings of key id i are stored at
+    positions offsets[i] to offsets[i+1], sorted by weight (descending).
+    All files are memory-mapped.
+    The weights are precomputed at build time: BM25 term weights, term frequencies,
+    or weights given per document (e.g. the popularity of the document).
+    """
+
+    def __init__(self, path_to_directory):
+        self.keys = marisa_trie.Trie().mmap(os.path.join(path_to_directory, "keys.marisa"))
+        self.offsets = np.load(os.path.join(path_to_directory, "offsets.npy"), mmap_mode="r")
+        self.document_ids = np.load(os.path.join(path_to_directory, "document_ids.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path_to_directory, "weights.npy"), mmap_mode="r")
+        with open(os.path.join(path_to_directory, "meta.json"), "r") as fp:
+            self.meta = json.load(fp)
+
+    def get_postings(self, key, limit=None):
+        """
+        Retrieve the postings for the key: returns a (document ids, weights)-tuple of arrays,
+        sorted by weight (descending). If a limit is given, only the top postings are returned.
+        """
+        try:
+            key_id = self.keys[key]
+        except KeyError:
+            return np.zeros(0, dtype=self.document_ids.dtype), np.zeros(0, dtype=self.weights.dtype)
+        start = self.offsets[key_id]
+        end = self.offsets[key_id + 1]
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.document_ids[start:end], self.weights[start:end]
+
+    def get_document_frequency(self, key):
+        """Number of documents with the key."""
+        try:
+            key_id = self.keys[key]
+        except KeyError:
+            return 0
+        return int(self.offsets[key_id + 1] - self.offsets[key_id])
+
+    @staticmethod
+    def build(get_documents, path_to_directory, bm25=True, k1=1.2, b=0.75, get_document_weight=None):
+        """
+        Create the index for the documents, in two passes over the documents:
+        first the key statistics are collected, then the postings are written.
+        get_documents is a function returning an iterator of (document id, keys)-tuples,
+        with the document id being a non-negative integer (int32).
+        With bm25=True the postings store BM25 term weights, the term frequency otherwise.
+        If get_document_weight is given, the postings store the weight of the document instead.
+        """
+        # first pass: document frequencies
+        document_frequencies = Counter()
+        number_of_documents = 0
+        total_length = 0
+        for _, keys in get_documents():
+            document_frequencies.update(set(keys))
+            number_of_documents += 1
+            total_length += len(keys)
+        average_length = total_length / number_of_documents if number_of_documents else 0
+
+        # offsets of the postings lists (by key id)
+        os.makedirs(path_to_directory, exist_ok=True)
+        trie = marisa_trie.Trie(document_frequencies.keys())
+        trie.save(os.path.join(path_to_directory, "keys.marisa"))
+        counts = np.zeros(len(trie), dtype=np.int64)
+        for key, document_frequency in document_frequencies.items():
+            counts[trie[key]] = document_frequency
+        offsets = np.zeros(len(trie) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        idfs = np.log(1 + (number_of_documents - counts + 0.5) / (counts + 0.5))
+        del document_frequencies
+
+        # second pass: postings
+        number_of_postings = int(offsets[-1])
+        document_ids = np.lib.format.open_memmap(
+            os.path.join(path_to_directory, "document_ids.npy"), mode="w+", dtype=np.int32, shape=(number_of_postings,)
+        )
+        weights = np.lib.format.open_memmap(
+            os.path.join(path_to_directory, "weights.npy"), mode="w+", dtype=np.float32, shape=(number_of_postings,)
+        )
+        cursors = offsets[:-1].copy()
+        for document_id, keys in get_documents():
+            length_normalization = k1 * (1 - b + b * len(keys) / average_length) if average_length else k1
+            document_weight = get_document_weight(document_id) if get_document_weight else None
+            for key, term_frequency in Counter(keys).items():
+                key_id = trie[key]
+                position = cursors[key_id]
+                document_ids[position] = document_id
+                if document_weight is not None:
+                    weights[position] = document_weight
+                elif bm25:
+                    weights[position] = (
+                        idfs[key_id] * term_frequency * (k1 + 1) / (term_frequency + length_normalization)
+                    )
+                else:
+                    weights[position] = term_frequency
+                cursors[key_id] += 1
+
+        # sort the postings of each key by weight
+        for key_id in range(len(trie)):
+            start, end = offsets[key_id], offsets[key_id + 1]
+            if end - start > 1:
+                order = np.argsort(-weights[start:end], kind="stable")
+                document_ids[start:end] = document_ids[start:end][order]
+                weights[start:end] = weights[start:end][order]
+        document_ids.flush()
+        weights.flush()
+        np.save(os.path.join(path_to_directory, "offsets.npy"), offsets)
+        with open(os.path.join(path_to_directory, "meta.json"), "w") as fp:
+            json.dump(
+                {
+                    "number_of_documents": number_of_documents,
+                    "number_of_postings": number_of_postings,
+                    "average_length": average_length,
+                    "bm25": bm25 and get_document_weight is None,
+                    "k1": k1,
+                    "b": b,
+                },
+                fp,
+            )
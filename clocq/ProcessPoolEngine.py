@@ -0,0 +1,180 @@
+import gc
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+# KB and Wikipedia2Vec of the worker processes: set before the workers are forked,
+# so that the workers share the loaded KB (copy-on-write) and the memory-mapped embeddings
+_kb = None
+_wiki2vec = None
+
+
+def _connectivity_rows(candidates1, candidates2, deadline):
+    """
+    Compute the connectivity of the candidates1 (rows) and candidates2 (columns) in a worker.
+    Returns the block and the number of rows checked (the remaining rows are dropped once the deadline is reached).
+    """
+    block = np.zeros((len(candidates1), len(candidates2)), dtype=np.float32)
+    for i, item1 in enumerate(candidates1):
+        if deadline is not None and time.time() >= deadline:
+            return block, i
+        for j, item2 in enumerate(candidates2):
+            block[i, j] = _kb.connectivity_check(item1, item2)
+    return block, len(candidates1)
+
+
+def _coherence_block(candidates1, candidates2):
+    """Compute the coherence of the candidates1 (rows) and candidates2 (columns) in a worker."""
+    candidates1_matrix = _wiki2vec.embed_kb_items(candidates1)
+    candidates2_matrix = _wiki2vec.embed_kb_items(candidates2)
+    return _wiki2vec.cosine_similarity_matrix(candidates1_matrix, candidates2_matrix)
+
+
+def _embed_items(items):
+    """Embed the KB items in a worker (KB items without embedding are zero rows)."""
+    return _wiki2vec.embed_kb_items(items)
+
+
+class ProcessPoolEngine:
+    """
+    Computes the connectivity and coherence blocks in a persistent pool of worker processes,
+    so that the pure-Python connectivity checks are not serialized by the GIL.
+    The workers are forked once, when the engine is created (i.e. after the KB is loaded,
+    and before any requests are processed), and inherit the KB and embeddings from the
+    parent process: only the candidates and the resulting blocks are sent per task.
+    The connectivity blocks are split into row chunks, so that a question with few
+    question words also uses multiple processes. Requires the fork start method (Linux).
+
+    The KB is shared copy-on-write: objects are moved out of reach of the garbage collector
+    before forking (gc.freeze), but reference counting still writes to the pages of the KB objects
+    used by a worker, so each worker can grow up to the size of the KB over time.
+    The engine should be created before any threads are started or connections are opened.
+    With caches shared among questions (see SharedCaches), the caches are used in the
+    parent process: only the missing results are computed by the workers.
+    """
+
+    def __init__(self, kb, wiki2vec, number_of_processes):
+        global _kb, _wiki2vec
+        _kb = kb
+        _wiki2vec = wiki2vec
+        # load the Wikipedia2Vec model before forking, so that it is shared by all workers
+        wiki2vec.wiki2vec
+        self.wiki2vec = wiki2vec
+        self.number_of_processes = number_of_processes
+        # avoid that garbage collection in the workers writes to (i.e. copies) the shared pages
+        gc.freeze()
+        self.pool = multiprocessing.get_context("fork").Pool(number_of_processes)
+
+    def process_connectivity(self, connectivity_graph, pairs, budget=None, cache=None):
+        """
+        Populate the connectivity graph for the given (index1, index2, candidates1, candidates2)-tuples.
+        If a latency budget is given, the remaining checks are dropped once the deadline is reached.
+        With a cache, only the rows with KB item pairs that are not cached are checked by the workers.
+        Returns the number of connectivity checks (including the cached ones, excluding the dropped ones).
+        """
+        if not pairs:
+            return 0
+        deadline = budget.start + budget.deadline_ms / 1000 if budget and budget.is_set() else None
+        blocks = dict()
+        rows_to_check = dict()
+        number_of_checks = 0
+        for index1, index2, candidates1, candidates2 in pairs:
+            block = np.zeros((len(candidates1), len(candidates2)), dtype=np.float32)
+            rows = list(range(len(candidates1)))
+            if cache is not None:
+                rows = [i for i in rows if not self._lookup_connectivity_row(cache, block, i, candidates1, candidates2)]
+            blocks[(index1, index2)] = block
+            rows_to_check[(index1, index2)] = rows
+            number_of_checks += (len(candidates1) - len(rows)) * len(candidates2)
+        chunks_per_pair = math.ceil(self.number_of_processes / len(pairs))
+        tasks = list()
+        for index1, index2, candidates1, candidates2 in pairs:
+            rows = rows_to_check[(index1, index2)]
+            rows_per_chunk = max(1, math.ceil(len(rows) / chunks_per_pair))
+            for start in range(0, len(rows), rows_per_chunk):
+                chunk = rows[start : start + rows_per_chunk]
+                chunk_candidates = [candidates1[i] for i in chunk]
+                result = self.pool.apply_async(_connectivity_rows, (chunk_candidates, candidates2, deadline))
+                tasks.append((index1, index2, candidates1, candidates2, chunk, result))
+        for index1, index2, candidates1, candidates2, chunk, result in tasks:
+            rows_block, checked_rows = result.get()
+            block = blocks[(index1, index2)]
+            block[chunk] = rows_block
+            number_of_checks += checked_rows * len(candidates2)
+            if checked_rows < len(chunk):
+                budget.degrade("truncated_connectivity")
+            if cache is not None:
+                for i in chunk[:checked_rows]:
+                    for j, item2 in enumerate(candidates2):
+                        cache.store(self._get_connectivity_key(candidates1[i], item2), float(block[i, j]))
+        for (index1, index2), block in blocks.items():
+            connectivity_graph.set_block(index1, index2, block)
+        return number_of_checks
+
+    def _lookup_connectivity_row(self, cache, block, i, candidates1, candidates2):
+        """Fill the row of the block with the cached connectivity. Returns whether all pairs of the row were cached."""
+        for j, item2 in enumerate(candidates2):
+            found, connectivity = cache.lookup(self._get_connectivity_key(candidates1[i], item2))
+            if not found:
+                return False
+            block[i, j] = connectivity
+        return True
+
+    @staticmethod
+    def _get_connectivity_key(item1, item2):
+        """Key of the KB item pair in the cache (same as in ConnectivityScoreProcessor)."""
+        return (item1, item2) if item1 <= item2 else (item2, item1)
+
+    def process_coherence(self, coherence_graph, pairs, cache=None):
+        """
+        Populate the coherence graph for the given (index1, index2, candidates1, candidates2)-tuples.
+        With a cache (of embeddings), only the KB items that are not cached are embedded by the workers,
+        and the blocks are computed from the embeddings in the parent process.
+        """
+        if cache is None:
+            tasks = [
+                (index1, index2, self.pool.apply_async(_coherence_block, (candidates1, candidates2)))
+                for index1, index2, candidates1, candidates2 in pairs
+            ]
+            for index1, index2, result in tasks:
+                coherence_graph.set_block(index1, index2, result.get())
+            return
+        # KB items in order of occurrence (without duplicates)
+        items = dict.fromkeys(item for _, _, candidates1, candidates2 in pairs for item in candidates1 + candidates2)
+        vectors = dict()
+        missing_items = list()
+        for item in items:
+            found, vector = cache.lookup(item)
+            if found:
+                vectors[item] = vector
+            else:
+                missing_items.append(item)
+        if missing_items:
+            items_per_chunk = math.ceil(len(missing_items) / self.number_of_processes)
+            chunks = [
+                missing_items[start : start + items_per_chunk]
+                for start in range(0, len(missing_items), items_per_chunk)
+            ]
+            results = [self.pool.apply_async(_embed_items, (chunk,)) for chunk in chunks]
+            for chunk, result in zip(chunks, results):
+                for item, vector in zip(chunk, result.get()):
+                    vectors[item] = vector
+                    cache.store(item, vector)
+        for index1, index2, candidates1, candidates2 in pairs:
+            candidates1_matrix = self._stack_vectors(vectors, candidates1)
+            candidates2_matrix = self._stack_vectors(vectors, candidates2)
+            coherence_graph.set_block(
+                index1, index2, self.wiki2vec.cosine_similarity_matrix(candidates1_matrix, candidates2_matrix)
+            )
+
+    def _stack_vectors(self, vectors, items):
+        """Returns the matrix of the embeddings of the KB items (one row per KB item)."""
+        matrix = np.array([vectors[item] for item in items], dtype=np.float32)
+        return matrix.reshape(-1, self.wiki2vec.get_dimension())
+
+    def close(self):
+        """Terminate the worker processes."""
+        self.pool.close()
+        self.pool.join()
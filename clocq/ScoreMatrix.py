@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class ScoreMatrix:
+    """
+    Pairwise scores among the candidate KB items of all question words.
+    The scores are stored as dense m x m blocks of d x d float32 matrices:
+    block (i, j) holds the scores between the candidates of question words
+    i and j, indexed by the positions of the candidates in their lists.
+    Pairs that are not scored (or scored 0) are stored as -inf, i.e. as missing edges.
+    Each block is written by a single processor, so no lock is required.
+    For lazy scoring, single rows can be established on demand: a mask
+    remembers which pairs were already scored. Concurrent lazy writes of
+    the same pair store identical scores, so no lock is required either.
+    """
+
+    def __init__(self, number_of_question_words, d):
+        self.number_of_question_words = number_of_question_words
+        self.d = d
+        self.scores = np.full(
+            (number_of_question_words, number_of_question_words, d, d), -np.inf, dtype=np.float32
+        )
+        self.computed = np.zeros((number_of_question_words, number_of_question_words, d, d), dtype=bool)
+
+    def set_block(self, index1, index2, block):
+        """
+        Store the scores between the candidates of the two question words.
+        The block is given as a (number of candidates1 x number of candidates2) array.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if not block.size:
+            return
+        block = np.where(block == 0, -np.inf, block)
+        rows, columns = block.shape
+        self.scores[index1, index2, :rows, :columns] = block
+        self.scores[index2, index1, :columns, :rows] = block.T
+        self.computed[index1, index2, :rows, :columns] = True
+        self.computed[index2, index1, :columns, :rows] = True
+
+    def get_missing_positions(self, index1, position1, index2, number_of_candidates2):
+        """
+        Returns the positions of the candidates of question word index2,
+        for which the score with the given candidate was not established yet.
+        """
+        return np.flatnonzero(~self.computed[index1, index2, position1, :number_of_candidates2])
+
+    def set_row(self, index1, position1, index2, positions2, scores):
+        """Store the scores between a single candidate and the candidates (at positions2) of question word index2."""
+        scores = np.asarray(scores, dtype=np.float32)
+        scores = np.where(scores == 0, -np.inf, scores)
+        self.scores[index1, index2, position1, positions2] = scores
+        self.scores[index2, index1, positions2, position1] = scores
+        self.computed[index1, index2, position1, positions2] = True
+        self.computed[index2, index1, positions2, position1] = True
+
+    def get_single_scores(self, question_word_index, positions=None):
+        """
+        Compute the maximum score each candidate of the question word can get in
+        any context tuple (exactly one connection per other question word).
+        The scores for all candidates (or the candidates at the given positions)
+        are computed at once, with one max-reduction per other question word.
+        Returns an array with one score per candidate position.
+        """
+        if positions is None:
+            positions = slice(None)
+        if self.number_of_question_words == 1:
+            return np.zeros(self.d)[positions]
+        other_indexes = [i for i in range(self.number_of_question_words) if not i == question_word_index]
+        # maximum weight per other question word: shape (m-1, number of positions)
+        scores = self.scores[question_word_index, other_indexes][:, positions, :]
+        max_weights = scores.max(axis=2).astype(np.float64)
+        max_weights[np.isneginf(max_weights)] = 0
+        # sum up sequentially, to obtain the same values for any selection of positions
+        maximum_weight = np.zeros(max_weights.shape[1])
+        for weights in max_weights:
+            maximum_weight += weights
+        return maximum_weight / (self.number_of_question_words - 1)
+
+    def get_score(self, index1, position1, index2, position2):
+        """Returns the score between the two candidates (0 if not scored)."""
+        score = self.scores[index1, index2, position1, position2]
+        if np.isneginf(score):
+            return 0
+        return float(score)
@@ -0,0 +1,27 @@
+from clocq.LRUCache import LRUCache
+
+
+class SharedCaches:
+    """
+    Results shared among the questions of a batch (see CLOCQAlgorithm.get_search_spaces):
+    the candidate KB items of question words, the connectivity of KB item pairs,
+    the embeddings of KB items (for coherence), and the neighborhoods of KB items.
+    All caches are bounded, so that arbitrarily large batches can be processed.
+    """
+
+    def __init__(
+        self, candidates_size=100000, connectivity_size=1000000, embeddings_size=100000, neighborhoods_size=1000
+    ):
+        self.candidates = LRUCache(candidates_size)
+        self.connectivity = LRUCache(connectivity_size)
+        self.embeddings = LRUCache(embeddings_size)
+        self.neighborhoods = LRUCache(neighborhoods_size)
+
+    def get_statistics(self):
+        """Returns the statistics of the individual caches."""
+        return {
+            "candidates": self.candidates.get_statistics(),
+            "connectivity": self.connectivity.get_statistics(),
+            "embeddings": self.embeddings.get_statistics(),
+            "neighborhoods": self.neighborhoods.get_statistics(),
+        }
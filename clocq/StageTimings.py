@@ -0,0 +1,98 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageTimings:
+    """
+    Records the time spent in the stages of a single search space request (if enabled).
+    For each stage, the wall time (from the first start to the last end, since the stages of
+    the individual question words and pairs overlap), the summed time of the individual calls,
+    their CPU time (of the threads running the calls) and the number of calls are recorded.
+    Further, counts (e.g. of connectivity checks) can be recorded.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.time()
+        self.stages = dict()
+        self.counts = dict()
+        self.lock = threading.Lock()
+
+    def is_set(self):
+        """Returns whether the timings are recorded at all."""
+        return self.enabled
+
+    @contextmanager
+    def measure(self, stage, cpu_time=True):
+        """
+        Measure the code within the with-block as part of the stage. The CPU time
+        should not be measured for code that awaits (the thread runs other coroutines meanwhile).
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        cpu_start = time.thread_time() if cpu_time else None
+        try:
+            yield
+        finally:
+            end = time.time()
+            cpu_time_used = time.thread_time() - cpu_start if cpu_time else None
+            self._record(stage, start, end, cpu_time_used)
+
+    def timed(self, stage, function):
+        """Returns the function, measured as part of the stage whenever it is called."""
+        if not self.enabled:
+            return function
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            with self.measure(stage):
+                return function(*args, **kwargs)
+
+        return timed_function
+
+    def count(self, name, value=1):
+        """Add the value to the count with the given name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def _record(self, stage, start, end, cpu_time):
+        """Add a single call to the stage."""
+        with self.lock:
+            if not stage in self.stages:
+                self.stages[stage] = {"start": start, "end": end, "time": 0, "cpu_time": None, "calls": 0}
+            stage_timings = self.stages[stage]
+            stage_timings["start"] = min(stage_timings["start"], start)
+            stage_timings["end"] = max(stage_timings["end"], end)
+            stage_timings["time"] += end - start
+            if cpu_time is not None:
+                stage_timings["cpu_time"] = (stage_timings["cpu_time"] or 0) + cpu_time
+            stage_timings["calls"] += 1
+
+    def to_dict(self, **counts):
+        """
+        Returns the timings (in ms): the total time of the request so far, and for each stage the
+        start (relative to the request), the wall time, the summed time and CPU time of the calls,
+        and the number of calls. The given counts are added to the recorded counts.
+        """
+        with self.lock:
+            stages = {
+                stage: {
+                    "start_ms": (stage_timings["start"] - self.start) * 1000,
+                    "wall_ms": (stage_timings["end"] - stage_timings["start"]) * 1000,
+                    "time_ms": stage_timings["time"] * 1000,
+                    "cpu_ms": None if stage_timings["cpu_time"] is None else stage_timings["cpu_time"] * 1000,
+                    "calls": stage_timings["calls"],
+                }
+                for stage, stage_timings in self.stages.items()
+            }
+            return {
+                "total_ms": (time.time() - self.start) * 1000,
+                "stages": stages,
+                "counts": dict(self.counts, **counts),
+            }
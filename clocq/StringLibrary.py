@@ -1,18 +1,19 @@
-import json
+import asyncio
 import re
 import time
 import os
 
 import requests
-import spacy
-import stanza
+
+from clocq.PersistentCache import PersistentCache
+from clocq.Tokenizer import Tokenizer
 
 
 class StringLibrary:
     def __init__(self, path_to_stopwords, tagme_token="", path_to_tagme_ner_cache=None):
         # load stopwords
-        with open(path_to_stopwords, "r") as fp:
-            self.stopwords = fp.read().split("\n")
+        self.tokenizer = Tokenizer(path_to_stopwords)
+        self.stopwords = self.tokenizer.stopwords
 
         # create session for faster connections
         self.request_session = requests.Session()
@@ -20,25 +21,18 @@ class StringLibrary:
         # initialize TagME (default NER)
         self.path_to_tagme_ner_cache = path_to_tagme_ner_cache
         self._initialize_tagme_NER_cache()
-        self.cache_changed = False
         self.tagme_token = tagme_token
 
     def _initialize_tagme_NER_cache(self):
         """
-        Initialize a TagME NER cache, either from an existing
-        file (if given), or as a runtime cache.
+        Initialize a TagME NER cache, either persisted on disk
+        (if a path is given), or as a runtime cache.
         """
-        if self.path_to_tagme_ner_cache:
-            with open(self.path_to_tagme_ner_cache, "r") as fp:
-                self.tagme_NER_cache = json.load(fp)
-        else:
-            self.tagme_NER_cache = dict()
+        self.tagme_NER_cache = PersistentCache.open(self.path_to_tagme_ner_cache)
 
     def store_tagme_NER_cache(self):
-        """Store the TagME NER cache on disk."""
-        if self.path_to_tagme_ner_cache and self.cache_changed:
-            with open(self.path_to_tagme_ner_cache, "w") as fp:
-                json.dump(self.tagme_NER_cache, fp)
+        """Store the TagME NER cache on disk (entries are already persisted on store)."""
+        self.tagme_NER_cache.flush()
 
     def get_question_words(self, question, ner="tagme", nlp=None):
         """
@@ -46,50 +40,58 @@ class StringLibrary:
         Named entity phrases can be detected by the specified ner method.
         If 'ner' is set to False, each word is considered individually.
         Stopwords, symbols and punctuations are removed.
+        Returns None if the NER failed (e.g. TagME could not be reached).
         """
-        question_words = []
-        # apply NER
         entity_spots = self._apply_NER(question, ner, nlp)
+        if entity_spots is None:
+            return None
+        return self._get_question_words(question, entity_spots)
+
+    async def aget_question_words(self, question, ner="tagme", nlp=None, executor=None):
+        """
+        Same as get_question_words, for use within asyncio: the TagME requests are awaited
+        (see atagme_NER), and the spaCy or stanza NER runs in the executor (the default executor if None).
+        """
+        if ner == "tagme":
+            entity_spots = await self.atagme_NER(question, executor)
+        elif ner in ("spacy", "stanza"):
+            loop = asyncio.get_running_loop()
+            entity_spots = await loop.run_in_executor(executor, self._apply_NER, question, ner, nlp)
+        else:
+            entity_spots = self._apply_NER(question, ner, nlp)
+        if entity_spots is None:
+            return None
+        return self._get_question_words(question, entity_spots)
+
+    def get_question_words_batch(self, questions, ner="tagme", nlp=None, batch_size=64, n_process=1):
+        """
+        Extracts the question words for a list of questions (same result as get_question_words).
+        With the spaCy or stanza NER, the questions are processed in batches of batch_size
+        (spaCy can further use n_process worker processes). None for questions the NER failed for.
+        """
+        entity_spots_list = self._apply_NER_batch(questions, ner, nlp, batch_size, n_process)
+        return [
+            None if entity_spots is None else self._get_question_words(question, entity_spots)
+            for question, entity_spots in zip(questions, entity_spots_list)
+        ]
+
+    def _get_question_words(self, question, entity_spots):
+        """Extracts the question words from the question, given the detected entity mentions."""
+        question_words = []
         for spot in entity_spots:
             if spot.lower() in self.stopwords:
                 continue
             question = question.replace(spot, "")
             question_words.append(spot)
-        # remove symbols
-        question = (
-            question.replace(",", "")
-            .replace("!", "")
-            .replace("?", "")
-            .replace(".", "")
-            .replace("'", "")
-            .replace('"', "")
-            .replace(":", "")
-            .replace("’", "")
-            .replace("{", "")
-            .replace("}", "")
-        )
-        # expand the question by whitespaces to be able to find the stopwords
-        question = (" " + question + " ").lower()
-        # remove stopwords
-        for stopword in self.stopwords:
-            while " " + stopword + " " in question:
-                question = question.replace(" " + stopword + " ", " ")
-        # remove remaining s from plural or possesive expressions
-        question = question.replace(" s ", " ")
-        # remove double whitespaces
-        while "  " in question:
-            question = question.replace("  ", " ")
-        # remove the whitespace(s) at the front and end
-        question = question.strip()
-        # get all question words
-        question_words += question.split(" ")
+        # get all question words (symbols and stopwords removed)
+        question_words += self.tokenizer.get_question_words(question)
         question_words = [question_word for question_word in question_words if question_word.strip()]
         return question_words
 
     def _apply_NER(self, question, ner="tagme", nlp=None):
         """
         Apply the given NER method on the question.
-        Returns all detected entity mentions.
+        Returns all detected entity mentions (None if the NER failed).
         """
         if ner is None:
             return []
@@ -100,31 +102,83 @@ class StringLibrary:
         elif ner == "stanza":
             return self.stanza_NER(question, nlp)
 
+    def _apply_NER_batch(self, questions, ner="tagme", nlp=None, batch_size=64, n_process=1):
+        """
+        Apply the given NER method on the list of questions.
+        Returns the detected entity mentions for each question.
+        """
+        if ner == "spacy":
+            return self.spacy_NER_batch(questions, nlp, batch_size, n_process)
+        elif ner == "stanza":
+            return self.stanza_NER_batch(questions, nlp, batch_size)
+        return [self._apply_NER(question, ner, nlp) for question in questions]
+
+    @staticmethod
+    def load_NER_pipeline(ner):
+        """
+        Load the pipeline for the given NER method (spaCy or stanza).
+        Returns None for the other methods, which require no pipeline.
+        """
+        if ner == "stanza":
+            import stanza
+
+            return stanza.Pipeline(lang="en", processors="tokenize,ner")
+        elif ner == "spacy":
+            import spacy
+
+            return spacy.load("en_core_web_sm")
+        return None
+
     def tagme_NER(self, question, recursion_depth=0):
         """
         Apply the TagME NER method on the question.
-        Returns all detected entity mentions.
+        Returns all detected entity mentions, or None if TagME could not be reached (after 5 attempts).
         """
         # check whether result is there in cache
         if recursion_depth == 5:
-            return []
-        if self.tagme_NER_cache.get(question):
-            return self.tagme_NER_cache[question]
+            return None
+        entity_spots = self.tagme_NER_cache.get(question)
+        if entity_spots:
+            return entity_spots
         try:
-            results = self.request_session.get(
-                "https://tagme.d4science.org/tagme/spot?lang=en&gcube-token=" + self.tagme_token + "&text=" + question
-            ).json()
-            entity_spots = []
-            for result in results["spots"]:
-                entity_spots.append(result["spot"])
+            entity_spots = self._tagme_spot_request(question)
             # store result in cache
-            self.tagme_NER_cache[question] = entity_spots
-            self.cache_changed = True
+            self.tagme_NER_cache.store(question, entity_spots)
             return entity_spots
         except:
             time.sleep(1)
             return self.tagme_NER(question, recursion_depth=recursion_depth+1)
 
+    async def atagme_NER(self, question, executor=None):
+        """
+        Same as tagme_NER, for use within asyncio: the requests (and the cache lookups) run in the
+        executor (the default executor if None), and the retries are awaited without blocking a thread.
+        """
+        loop = asyncio.get_running_loop()
+        for _ in range(5):
+            # check whether result is there in cache
+            entity_spots = await loop.run_in_executor(executor, self.tagme_NER_cache.get, question)
+            if entity_spots:
+                return entity_spots
+            try:
+                entity_spots = await loop.run_in_executor(executor, self._tagme_spot_request, question)
+                # store result in cache
+                await loop.run_in_executor(executor, self.tagme_NER_cache.store, question, entity_spots)
+                return entity_spots
+            except:
+                await asyncio.sleep(1)
+        return None
+
+    def _tagme_spot_request(self, question):
+        """Send the TagME spotting request for the question. Returns all detected entity mentions."""
+        results = self.request_session.get(
+            "https://tagme.d4science.org/tagme/spot?lang=en&gcube-token=" + self.tagme_token + "&text=" + question
+        ).json()
+        entity_spots = []
+        for result in results["spots"]:
+            entity_spots.append(result["spot"])
+        return entity_spots
+
     def spacy_NER(self, question, spacy_nlp):
         """
         Apply the spaCy NER method on the question.
@@ -145,6 +199,27 @@ class StringLibrary:
         entities = [entity.text for entity in doc.ents]
         return entities
 
+    def spacy_NER_batch(self, questions, spacy_nlp, batch_size=64, n_process=1):
+        """
+        Apply the spaCy NER method on the list of questions (using nlp.pipe).
+        Returns all detected entity mentions for each question.
+        """
+        docs = spacy_nlp.pipe(questions, batch_size=batch_size, n_process=n_process)
+        return [[ent.text for ent in doc.ents] for doc in docs]
+
+    def stanza_NER_batch(self, questions, stanza_nlp, batch_size=64):
+        """
+        Apply the stanza NER method on the list of questions, processing
+        batch_size questions at once. Returns all detected entity mentions for each question.
+        """
+        import stanza
+
+        entities = list()
+        for i in range(0, len(questions), batch_size):
+            docs = stanza_nlp([stanza.Document([], text=question) for question in questions[i : i + batch_size]])
+            entities += [[entity.text for entity in doc.ents] for doc in docs]
+        return entities
+
     def tagme_NED(self, question, recursion_depth=0):
         """
         Apply the TagME NED method on the question.
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# number of threads shared by all requests
+DEFAULT_NUMBER_OF_THREADS = 32
+
+
+class TaskScheduler:
+    """
+    Runs graphs of dependent tasks (DAGs) on a persistent thread pool, which is shared
+    among all requests. Each task is submitted as soon as all the tasks it depends on
+    are done: tasks never wait for other tasks within the pool (completions are
+    propagated by callbacks), so the pool cannot deadlock on nested waits.
+    """
+
+    def __init__(self, number_of_threads=DEFAULT_NUMBER_OF_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=number_of_threads)
+
+    def run(self, tasks):
+        """
+        Run the tasks, given as dict: name -> (function, names of the tasks it depends on).
+        Blocks until all tasks are done. If a task fails, the tasks depending on it are
+        not run, and the first exception is raised once the remaining tasks are done.
+        """
+        graph = TaskGraph(self.executor, tasks)
+        graph.start()
+        graph.done.wait()
+        if graph.exception is not None:
+            raise graph.exception
+
+    async def arun(self, tasks):
+        """
+        Same as run, for use within asyncio: the tasks run on the thread pool,
+        and are awaited without blocking a thread (or the event loop).
+        """
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def resolve():
+            if not done.done():
+                done.set_result(None)
+
+        graph = TaskGraph(self.executor, tasks, callback=lambda: loop.call_soon_threadsafe(resolve))
+        graph.start()
+        await done
+        if graph.exception is not None:
+            raise graph.exception
+
+    async def arun_function(self, function):
+        """Run a single function on the thread pool (for use within asyncio). Returns its result."""
+        return await asyncio.wrap_future(self.executor.submit(function))
+
+    def shutdown(self):
+        """Stop the threads (after the running tasks)."""
+        self.executor.shutdown(wait=True)
+
+
+class TaskGraph:
+    """
+    State of a single run of tasks (see TaskScheduler).
+    The callback (if given) is called once all tasks are done.
+    """
+
+    def __init__(self, executor, tasks, callback=None):
+        self.executor = executor
+        self.tasks = tasks
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.exception = None
+        self.failed = set()
+        # number of dependencies that are not done yet, and the dependent tasks of each task
+        self.waiting_for = dict()
+        self.dependents = {name: list() for name in tasks}
+        for name, (_, dependencies) in tasks.items():
+            dependencies = set(dependencies)
+            for dependency in dependencies:
+                if not dependency in tasks:
+                    raise Exception(f"Task {name} depends on unknown task {dependency}!")
+                self.dependents[dependency].append(name)
+            self.waiting_for[name] = len(dependencies)
+        self.pending = len(tasks)
+
+    def start(self):
+        """Submit all tasks without dependencies."""
+        if not self.pending:
+            self._finish()
+            return
+        for name, waiting_for in list(self.waiting_for.items()):
+            if not waiting_for:
+                self._submit(name)
+
+    def _submit(self, name):
+        """Submit the task, or skip it if one of its dependencies failed."""
+        if name in self.failed:
+            self._complete(name, None)
+            return
+        function, _ = self.tasks[name]
+        future = self.executor.submit(function)
+        future.add_done_callback(lambda future: self._complete(name, future.exception()))
+
+    def _complete(self, name, exception):
+        """Mark the task as done, and submit the dependent tasks that are ready."""
+        ready = list()
+        with self.lock:
+            if exception is not None:
+                if self.exception is None:
+                    self.exception = exception
+            failed = exception is not None or name in self.failed
+            for dependent in self.dependents[name]:
+                if failed:
+                    self.failed.add(dependent)
+                self.waiting_for[dependent] -= 1
+                if not self.waiting_for[dependent]:
+                    ready.append(dependent)
+            self.pending -= 1
+            finished = not self.pending
+        if finished:
+            self._finish()
+        for dependent in ready:
+            self._submit(dependent)
+
+    def _finish(self):
+        """Mark the run as done."""
+        self.done.set()
+        if self.callback is not None:
+            self.callback()
@@ -0,0 +1,48 @@
+SYMBOLS = ",!?.'\":’{}"
+
+
+class Tokenizer:
+    """
+    Single-pass tokenization of questions and phrases: symbols are removed with a
+    translation table, and stopwords are looked up in a frozen set (stopwords
+    are single words, one per line in the stopwords file).
+    """
+
+    def __init__(self, path_to_stopwords):
+        with open(path_to_stopwords, "r") as fp:
+            self.stopwords = frozenset(fp.read().split("\n"))
+        self.symbol_table = str.maketrans("", "", SYMBOLS)
+
+    def is_stopword(self, word):
+        """Check whether the word is a stopword."""
+        return word in self.stopwords
+
+    def get_question_words(self, question):
+        """
+        Split the (remaining) question into question words: symbols and stopwords are removed,
+        as well as the remaining s from plural or possesive expressions.
+        """
+        # split into lowercased tokens (empty tokens mark double whitespaces)
+        tokens = question.translate(self.symbol_table).lower().split(" ")
+        tokens = [token for token in tokens if not token in self.stopwords]
+        # remove remaining s (of two adjacent s, the second one is kept)
+        words = list()
+        removed_s = False
+        for token in tokens:
+            if token == "s" and not removed_s:
+                removed_s = True
+                continue
+            removed_s = False
+            if token:
+                words.append(token)
+        # remove the whitespace(s) at the front and end
+        words = " ".join(words).strip().split(" ")
+        return [word for word in words if word.strip()]
+
+    def tokenize(self, string):
+        """Tokenize the string (used for BM25), keeping the case of words."""
+        return [word for word in string.replace(",", "").split() if not word in self.stopwords]
+
+    def get_words(self, phrase):
+        """Returns the (non-stopword) words in the phrase."""
+        return [word for word in phrase.split() if not word in self.stopwords]
@@ -3,8 +3,8 @@ import time
 
 from scipy.stats import entropy
 
-from clocq.FaginsAlgorithm import FaginsThresholdAlgorithm
-from clocq.WikidataSearch import CandidateList, WikidataSearch
+from clocq.FaginsAlgorithm import FaginsThresholdAlgorithm, TopkHeap, aggregate_scores
+from clocq.WikidataSearch import CandidateList
 
 
 class TopkProcessor:
@@ -29,6 +29,10 @@ class TopkProcessor:
         d=20,
         k="AUTO",
         wikidata_search_cache=None,
+        search_engine=None,
+        alias_table=None,
+        trigram_index=None,
+        candidate_cache=None,
         verbose=False,
     ):
         self.kb = kb
@@ -42,8 +46,6 @@ class TopkProcessor:
         self.connectivity_graph = connectivity_graph
         self.coherence_graph = coherence_graph
         self.wiki2vec = wiki2vec
-        # used for computing k (if applicable)
-        self._initialize_item_retrieval(d, wikidata_search_cache)
         # hyperparameters
         self.h_match = h_match
         self.h_rel = h_rel
@@ -58,38 +60,54 @@ class TopkProcessor:
         )
         # initialize candidate list
         self.candidate_list = CandidateList(
-            self.question_word, kb, list_depth=d, wikidata_search_cache=wikidata_search_cache
+            self.question_word,
+            kb,
+            list_depth=d,
+            wikidata_search_cache=wikidata_search_cache,
+            search_engine=search_engine,
+            alias_table=alias_table,
+            trigram_index=trigram_index,
+            candidate_cache=candidate_cache,
         )
         # priority queues for individual scores
         self.queue_matching_score = list()
         self.queue_connectivity_score = list()
         self.queue_relevance_score = list()
         self.queue_coherence_score = list()
-        # set k automatically for question word
-        if k == "AUTO":
-            self.k = self._set_k()
-        else:
-            self.k = int(k)
+        # set k automatically for question word (once the candidates are initialized)
+        self.auto_k = None
+        # k values and top-k lists for multiple configurations
+        self.ks = [self.k]
+        self.top_ks = None
 
-    def _initialize_item_retrieval(self, depth, wikidata_search_cache):
+    def initialize_candidates(self):
         """
-        Initialize a Wikidata search. The search can be initialized
-        with existing search results for (better) reproducibility of results.
+        Initialize the candidate KB items. Within the connectivity and coherence graphs,
+        the candidates are identified by the question word index and their position in the list.
+        For k=AUTO, k is determined on the full candidate list here, so that the searches
+        for all question words run in parallel (one thread per operator).
         """
-        if wikidata_search_cache:
-            self.search = WikidataSearch(depth, wikidata_search_cache)
-        else:
-            self.search = WikidataSearch(depth)
-
-    def add_candidates_to_graph(self):
-        """Add candidate KB items to graphs (connectivity and coherence)."""
-        # check if candidates already initialized (in k=AUTO setting)
-        if not self.candidate_list.get_items():
+        # check if candidates already initialized
+        if not self.candidate_list.initialized:
             self.candidate_list.initialize()
-        # add items to graphs
-        for node in self.candidate_list.get_items():
-            self.connectivity_graph.add_node(node, self.question_word_index)
-            self.coherence_graph.add_node(node, self.question_word_index)
+        self.k = self._resolve_k(self.k)
+        self.ks = [self.k]
+
+    async def ainitialize_candidates(self, executor=None):
+        """
+        Initialize the candidate KB items (for use within asyncio): only the search is awaited,
+        the lookups run in the executor, and k is determined once initialize_candidates is called.
+        """
+        if not self.candidate_list.initialized:
+            await self.candidate_list.ainitialize(executor)
+
+    def reduce_depth(self, d):
+        """
+        Keep only the top-d candidate KB items (used when the latency budget gets tight).
+        Before the candidates are initialized, this restricts the number of candidates retrieved.
+        """
+        self.d = d
+        self.candidate_list.truncate(d)
 
     def get_candidates(self):
         """Return all candidate KB items (left) in the list."""
@@ -103,7 +121,8 @@ class TopkProcessor:
         This uncertainty is computed by the entropy of the frequency
         distribution of candidate KB items in the KB.
         """
-        self.candidate_list.initialize()
+        if not self.candidate_list.initialized:
+            self.candidate_list.initialize()
         search_result = self.candidate_list.get_items()
         frequencies = list()
         # determine frequencies
@@ -122,48 +141,73 @@ class TopkProcessor:
         k = math.floor(ent) + 1
         return k
 
+    def _resolve_k(self, k):
+        """Returns the value of k for the given setting (computed only once for k=AUTO)."""
+        if k == "AUTO":
+            if self.auto_k is None:
+                self.auto_k = self._set_k()
+            return self.auto_k
+        return int(k)
+
     def initialize_scores(self):
         """
         Creates a list for each score, in which KB items are
         sorted in score-descending order.
         """
         start = time.time()
+        local_scores = self._initialize_local_scores()
+        # connectivity and coherence scores are computed for all candidates at once
+        connectivity_scores = self.connectivity_graph.get_single_connectivity_scores(self.question_word_index)
+        coherence_scores = self.coherence_graph.get_single_coherence_scores(self.question_word_index)
+        self._initialize_queues(local_scores, connectivity_scores, coherence_scores)
+        self._print_verbose(f"Time (initialize_scores): {time.time() - start}")
+
+    def _initialize_local_scores(self):
+        """
+        Scan the candidate list, and compute the matching and relevance scores,
+        which do not depend on the candidates of the other question words.
+        Returns a list of (item, matching score, relevance score)-tuples in list order.
+        """
         other_question_words = [
             word for i, word in enumerate(self.question_words) if not i == self.question_word_index
         ]
         other_question_words_vectors = self.wiki2vec.get_word_vectors(other_question_words)
+        scanned_items = list()
         for i in range(self.d):
             item = self.candidate_list.scan()
             if item is None:
                 break
-            item, score = item
+            scanned_items.append(item)
+        # relevance scores are computed for all candidates at once
+        items = [item for item, _ in scanned_items]
+        relevance_scores = self.wiki2vec.get_question_relevance_scores(items, other_question_words_vectors)
+        local_scores = list()
+        for (item, score), relevance_score in zip(scanned_items, relevance_scores):
             # matching
             matching_score = score
             # matching_score = self.wiki2vec.matching(item, self.question_word) # alternative to 1/rank
             matching_score = round(matching_score, 4)
-            self.queue_matching_score.append((item, matching_score))
             # relevance
-            relevance_score = self.wiki2vec.get_question_relevance_score(item, other_question_words_vectors)
-            relevance_score = round(relevance_score, 4)
+            relevance_score = round(float(relevance_score), 4)
+            local_scores.append((item, matching_score, relevance_score))
+        return local_scores
+
+    def _initialize_queues(self, local_scores, connectivity_scores, coherence_scores):
+        """Fill the individual queues, and sort them in score-descending order."""
+        for i, (item, matching_score, relevance_score) in enumerate(local_scores):
+            self.queue_matching_score.append((item, matching_score))
             self.queue_relevance_score.append((item, relevance_score))
             # connectivity
-            connectivity_score, max_weights = self.connectivity_graph.get_single_connectivity_score(
-                item, self.number_of_question_words, self.question_word_index
-            )
-            connectivity_score = round(connectivity_score, 4)
+            connectivity_score = round(float(connectivity_scores[i]), 4)
             self.queue_connectivity_score.append((item, connectivity_score))
             # coherence
-            coherence_score, max_weights = self.coherence_graph.get_single_coherence_score(
-                item, self.number_of_question_words, self.question_word_index
-            )
-            coherence_score = round(coherence_score, 4)
+            coherence_score = round(float(coherence_scores[i]), 4)
             self.queue_coherence_score.append((item, coherence_score))
         # sort the individual queues
         self.queue_matching_score = sorted(self.queue_matching_score, key=lambda j: j[1], reverse=True)
         self.queue_relevance_score = sorted(self.queue_relevance_score, key=lambda j: j[1], reverse=True)
         self.queue_connectivity_score = sorted(self.queue_connectivity_score, key=lambda j: j[1], reverse=True)
         self.queue_coherence_score = sorted(self.queue_coherence_score, key=lambda j: j[1], reverse=True)
-        self._print_verbose(f"Time (initialize_scores): {time.time() - start}")
 
     def compute_top_k(self, connectivity_graph, coherence_graph):
         """
@@ -175,22 +219,154 @@ class TopkProcessor:
         """
         self.connectivity_graph = connectivity_graph
         self.coherence_graph = coherence_graph
+        # resolve k before the candidate list is consumed by initialize_scores
+        self.k = self._resolve_k(self.k)
         self.initialize_scores()
         start = time.time()
         fagins = FaginsThresholdAlgorithm()
         self.top_k = fagins.apply(
-            self.queue_matching_score,
-            self.queue_relevance_score,
-            self.queue_connectivity_score,
-            self.queue_coherence_score,
+            [
+                self.queue_matching_score,
+                self.queue_relevance_score,
+                self.queue_connectivity_score,
+                self.queue_coherence_score,
+            ],
             (self.h_match, self.h_rel, self.h_conn, self.h_coh),
             k=self.k,
         )
+        self.ks = [self.k]
+        self.top_ks = [self.top_k]
         self._print_verbose(f"Time (FaginsAlgorithm) {time.time() - start}")
 
-    def get_top_k(self):
-        """Returns the top-k KB items for the question term."""
-        return self.top_k
+    def compute_top_k_configurations(self, configurations, connectivity_graph, coherence_graph):
+        """
+        Compute the top-k KB items for the question term, for a list of
+        (hyperparameters, k)-configurations. The queues are established only once,
+        and Fagin's TA computes the top-k items for all configurations in one pass.
+        """
+        self.connectivity_graph = connectivity_graph
+        self.coherence_graph = coherence_graph
+        # resolve k before the candidate list is consumed by initialize_scores
+        self.ks = [self._resolve_k(k) for _, k in configurations]
+        self.initialize_scores()
+        start = time.time()
+        fagins = FaginsThresholdAlgorithm()
+        self.top_ks = fagins.apply_configurations(
+            [
+                self.queue_matching_score,
+                self.queue_relevance_score,
+                self.queue_connectivity_score,
+                self.queue_coherence_score,
+            ],
+            [(hyperparameters, k) for (hyperparameters, _), k in zip(configurations, self.ks)],
+        )
+        self.k = self.ks[0]
+        self.top_k = self.top_ks[0]
+        self._print_verbose(f"Time (FaginsAlgorithm, {len(configurations)} configurations) {time.time() - start}")
+
+    def compute_top_k_lazy(self, configurations, lazy_processor):
+        """
+        Compute the top-k KB items for the question term, for a list of
+        (hyperparameters, k)-configurations, using lazy scoring.
+        Matching and relevance scores are computed first. Connectivity and coherence
+        scores are established only for candidates whose upper bound can still reach
+        the top-k threshold. The result is identical to compute_top_k_configurations:
+        in case of ties among the relevant scores (which are broken by the scan order
+        of Fagin's TA), all candidates are scored and TA is applied instead.
+        """
+        # resolve k before the candidate list is consumed
+        self.ks = [self._resolve_k(k) for _, k in configurations]
+        start = time.time()
+        local_scores = self._initialize_local_scores()
+        items = [item for item, _, _ in local_scores]
+        # connectivity and coherence scores established so far: position -> scores
+        established_scores = dict()
+        self.top_ks = list()
+        queues_initialized = False
+        for (hyperparameters, _), k in zip(configurations, self.ks):
+            top_k = None
+            # upper bounds require non-negative weights, positions require unique items
+            if min(hyperparameters) >= 0 and len(set(items)) == len(items):
+                top_k = self._lazy_top_k(local_scores, hyperparameters, k, lazy_processor, established_scores)
+            if top_k is None:
+                # fall back to scoring all candidates and applying TA
+                if not queues_initialized:
+                    lazy_processor.process_all(self.question_word_index)
+                    connectivity_scores = self.connectivity_graph.get_single_connectivity_scores(self.question_word_index)
+                    coherence_scores = self.coherence_graph.get_single_coherence_scores(self.question_word_index)
+                    self._initialize_queues(local_scores, connectivity_scores, coherence_scores)
+                    queues_initialized = True
+                fagins = FaginsThresholdAlgorithm()
+                top_k = fagins.apply(
+                    [
+                        self.queue_matching_score,
+                        self.queue_relevance_score,
+                        self.queue_connectivity_score,
+                        self.queue_coherence_score,
+                    ],
+                    hyperparameters,
+                    k=k,
+                )
+            self.top_ks.append(top_k)
+        self.k = self.ks[0]
+        self.top_k = self.top_ks[0]
+        self._print_verbose(
+            f"Time (lazy top-k, {len(established_scores)}/{len(local_scores)} candidates scored) {time.time() - start}"
+        )
+
+    def _lazy_top_k(self, local_scores, hyperparameters, k, lazy_processor, established_scores):
+        """
+        Compute the top-k items for a single configuration, establishing the
+        connectivity and coherence scores of candidates in the order of their upper bounds.
+        Returns None if ties among the relevant scores prevent an identical result.
+        """
+        upper_bounds = list()
+        for position, (item, matching_score, relevance_score) in enumerate(local_scores):
+            if position in established_scores:
+                connectivity_bound, coherence_bound = established_scores[position]
+            else:
+                connectivity_bound, coherence_bound = lazy_processor.get_upper_bounds(self.question_word_index, position)
+            upper_bounds.append(
+                aggregate_scores([matching_score, relevance_score, connectivity_bound, coherence_bound], hyperparameters)
+            )
+        order = sorted(range(len(local_scores)), key=lambda position: upper_bounds[position], reverse=True)
+        top_k_heap = TopkHeap(k)
+        aggregated_scores = list()
+        for position in order:
+            # remaining candidates can not reach the top-k
+            if not k or upper_bounds[position] < top_k_heap.kth_score():
+                break
+            if not position in established_scores:
+                established_scores[position] = self._establish_scores(position, lazy_processor)
+            item, matching_score, relevance_score = local_scores[position]
+            connectivity_score, coherence_score = established_scores[position]
+            scores = [matching_score, relevance_score, connectivity_score, coherence_score]
+            aggregated_score = aggregate_scores(scores, hyperparameters)
+            top_k_heap.push(aggregated_score, (item, scores))
+            aggregated_scores.append(aggregated_score)
+        # detect ties among the relevant scores
+        kth_score = top_k_heap.kth_score()
+        relevant_scores = [score for score in aggregated_scores if score > 0 and score >= kth_score]
+        if len(set(relevant_scores)) < len(relevant_scores):
+            return None
+        return FaginsThresholdAlgorithm().get_top_k_items(top_k_heap)
+
+    def _establish_scores(self, position, lazy_processor):
+        """Establish the connectivity and coherence scores of the candidate at the given position."""
+        lazy_processor.process_candidate(self.question_word_index, position)
+        connectivity_score = self.connectivity_graph.get_single_connectivity_scores(self.question_word_index, [position])[0]
+        coherence_score = self.coherence_graph.get_single_coherence_scores(self.question_word_index, [position])[0]
+        return round(float(connectivity_score), 4), round(float(coherence_score), 4)
+
+    def get_top_k(self, configuration_index=0):
+        """Returns the top-k KB items for the question term (for the given configuration)."""
+        if configuration_index == 0:
+            return self.top_k
+        return self.top_ks[configuration_index]
+
+    def get_k(self, configuration_index=0):
+        """Returns the value of k for the question term (for the given configuration)."""
+        return self.ks[configuration_index]
 
     def scan(self):
         """Returns the next top-k KB item for the question term."""
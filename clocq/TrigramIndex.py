@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from clocq.AliasTable import AliasTable, normalize
+from clocq.PostingsIndex import PostingsIndex
+
+# only the postings of the most popular names are considered for each trigram
+MAX_POSTINGS_PER_TRIGRAM = 20000
+# maximum number of candidate names verified with the edit distance
+MAX_VERIFICATIONS = 200
+
+
+def get_trigrams(string):
+    """Character trigrams of the string (padded with whitespaces)."""
+    string = "  " + string + "  "
+    return [string[i : i + 3] for i in range(len(string) - 2)]
+
+
+def get_max_edit_distance(string):
+    """Maximum edit distance tolerated for the string (depends on its length)."""
+    if len(string) < 4:
+        return 0
+    elif len(string) < 8:
+        return 1
+    return 2
+
+
+def bounded_levenshtein(string1, string2, max_distance):
+    """
+    Compute the edit distance between the strings, if at most max_distance.
+    Returns max_distance + 1 otherwise (the computation stops early).
+    """
+    if abs(len(string1) - len(string2)) > max_distance:
+        return max_distance + 1
+    previous_row = list(range(len(string2) + 1))
+    for i, char1 in enumerate(string1, 1):
+        current_row = [i]
+        for j, char2 in enumerate(string2, 1):
+            current_row.append(
+                min(previous_row[j] + 1, current_row[j - 1] + 1, previous_row[j - 1] + (not char1 == char2))
+            )
+        if min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+    return min(previous_row[-1], max_distance + 1)
+
+
+class TrigramIndex:
+    """
+    Typo-tolerant search for KB items: character trigram index over the normalized
+    labels and aliases in the alias table (trigram -> names). Candidate names need to share
+    sufficiently many trigrams with the search term, and are verified with a bounded edit distance.
+    Postings are sorted by the popularity of the names, and are bounded per trigram,
+    so that a search costs at most a few hundred thousand postings.
+    """
+
+    def __init__(self, alias_table, path_to_trigram_index):
+        self.alias_table = alias_table
+        self.index = PostingsIndex(path_to_trigram_index)
+        self.name_lengths = np.load(os.path.join(path_to_trigram_index, "name_lengths.npy"), mmap_mode="r")
+
+    def search_term(self, term, number_of_results=20):
+        """Search for KB items with a label or alias similar to the term (sorted by edit distance and popularity)."""
+        term = normalize(term)
+        max_distance = get_max_edit_distance(term)
+        trigrams = set(get_trigrams(term))
+        postings = [self.index.get_postings(trigram, limit=MAX_POSTINGS_PER_TRIGRAM)[0] for trigram in trigrams]
+        postings = [name_ids for name_ids in postings if len(name_ids)]
+        if not postings:
+            return []
+        # count filter: each edit destroys at most 3 trigrams
+        name_ids, counts = np.unique(np.concatenate(postings), return_counts=True)
+        candidates = counts >= len(trigrams) - 3 * max_distance
+        # length filter
+        candidates &= np.abs(self.name_lengths[name_ids].astype(np.int64) - len(term)) <= max_distance
+        name_ids, counts = name_ids[candidates], counts[candidates]
+        name_ids = name_ids[np.argsort(-counts, kind="stable")][:MAX_VERIFICATIONS]
+        # verification with bounded edit distance
+        matches = list()
+        for name_id in name_ids:
+            name = self.alias_table.index.keys.restore_key(int(name_id))
+            distance = bounded_levenshtein(term, name, max_distance)
+            if distance <= max_distance:
+                _, weights = self.alias_table.index.get_postings(name)
+                matches.append((distance, -float(np.sum(weights)), name))
+        # retrieve the KB items for the matching names
+        result = list()
+        for _, _, name in sorted(matches):
+            for kb_item in self.alias_table.lookup(name, number_of_results=number_of_results):
+                if not kb_item in result:
+                    result.append(kb_item)
+            if len(result) >= number_of_results:
+                break
+        return result[:number_of_results]
+
+    @staticmethod
+    def build(alias_table, path_to_trigram_index, verbose=True):
+        """
+        Create the trigram index for the names in the alias table.
+        Names are identified by their key id in the alias table, and their postings
+        are weighted by popularity (summed KB frequency of the KB items with this name).
+        """
+        start = time.time()
+        names = alias_table.index.keys
+
+        def get_documents():
+            for name, name_id in names.items():
+                yield name_id, get_trigrams(name)
+
+        def get_document_weight(name_id):
+            _, weights = alias_table.index.get_postings(names.restore_key(name_id))
+            return float(np.sum(weights))
+
+        PostingsIndex.build(get_documents, path_to_trigram_index, get_document_weight=get_document_weight)
+        name_lengths = np.zeros(len(names), dtype=np.int32)
+        for name, name_id in names.items():
+            name_lengths[name_id] = len(name)
+        np.save(os.path.join(path_to_trigram_index, "name_lengths.npy"), name_lengths)
+        if verbose:
+            print(f"Trigram index stored in {path_to_trigram_index} ({time.time() - start}s)")
+
+
+if __name__ == "__main__":
+    from clocq import config
+    from clocq.knowledge_base.KnowledgeBase import KnowledgeBase
+
+    # the KB is only required for decoding the KB items
+    kb = KnowledgeBase(config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS, max_items=10)
+    alias_table = AliasTable(kb, config.PATH_TO_ALIAS_TABLE)
+    path_to_trigram_index = sys.argv[1] if len(sys.argv) > 1 else config.PATH_TO_TRIGRAM_INDEX
+    TrigramIndex.build(alias_table, path_to_trigram_index)
@@ -1,77 +1,180 @@
+import asyncio
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
+# settings for the Wikidata search
+WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+SEARCH_TIMEOUT = 5  # seconds (per request)
+SEARCH_MAX_RETRIES = 5
+SEARCH_BACKOFF = 0.25  # seconds (doubled with each retry)
+SEARCH_MAX_BACKOFF = 2  # seconds
+SEARCH_POOL_SIZE = 20  # number of pooled connections
+
+# the exact matches in the alias table are used if there are at least this many (known) candidates,
+# and the typo-tolerant search is used if the search engine returns less
+MIN_CANDIDATES = 10
+
 
 class WikidataSearch:
-    def __init__(self, results_per_search=20, cache=None):
-        self.URL = "https://www.wikidata.org/w/api.php"
+    """
+    Client for the Wikidata search API. A single client can be shared among
+    all threads: keep-alive connections are pooled within one session,
+    the request parameters are created per search, and failed requests are
+    retried with bounded exponential backoff. The URL can be set to a
+    different endpoint (e.g. a mirror, or a local stub server for testing).
+    """
+
+    def __init__(
+        self,
+        results_per_search=20,
+        cache=None,
+        url=WIKIDATA_API_URL,
+        timeout=SEARCH_TIMEOUT,
+        max_retries=SEARCH_MAX_RETRIES,
+        pool_size=SEARCH_POOL_SIZE,
+    ):
+        self.URL = url
+        self.results_per_search = results_per_search
+        self.cache = cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # pooled keep-alive connections
         self.SESSION = requests.Session()
-        self.params = {
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.SESSION.mount("http://", adapter)
+        self.SESSION.mount("https://", adapter)
+        # requests of asearch_term (one thread per pooled connection, created on first use)
+        self.pool_size = pool_size
+        self.request_executor = None
+        self.request_executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """The executor for the requests of asearch_term, created on first use."""
+        if self.request_executor is None:
+            with self.request_executor_lock:
+                if self.request_executor is None:
+                    self.request_executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        return self.request_executor
+
+    def _get_params(self, term, number_of_results, namespace="0|120", offset=None):
+        """
+        Parameters for a single search request.
+        namespace "120" => search only in predicates, namespace "0" => search only in entities
+        """
+        params = {
             "action": "query",
             "format": "json",
             "list": "search",
-            "srlimit": results_per_search,
-            "srnamespace": "0|120",
-            "srprop": "titlesnippet|snippet"
-            # "srnamespace": "120" => search only in predicates
-            # "srnamespace": "0" => search only in entities
+            "srlimit": number_of_results,
+            "srnamespace": namespace,
+            "srprop": "titlesnippet|snippet",
+            "srsearch": term,
         }
-        self.cache = cache
+        if offset:
+            params["sroffset"] = offset
+        return params
+
+    def _request(self, params):
+        """
+        Send the search request, and return the KB items found.
+        Failed requests are retried (with exponential backoff), None is returned if all attempts fail.
+        """
+        for attempt in range(self.max_retries):
+            try:
+                return self._request_once(params)
+            except (requests.RequestException, ValueError, KeyError):
+                if attempt < self.max_retries - 1:
+                    time.sleep(self._get_backoff(attempt))
+        return None
 
-    def search_term(self, term, offset=None, recursion_depth=0):
+    async def _arequest(self, params):
+        """
+        Same as _request, for use within asyncio: the requests are sent from the executor
+        (on the pooled connections), and the backoff is awaited without blocking a thread.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries):
+            try:
+                return await loop.run_in_executor(self.executor, self._request_once, params)
+            except (requests.RequestException, ValueError, KeyError):
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self._get_backoff(attempt))
+        return None
+
+    def _request_once(self, params):
+        """
+        Send the search request, and return the KB items found. Raises a RequestException if the request fails,
+        and a ValueError or KeyError if the response is malformed.
+        """
+        res = self.SESSION.get(url=self.URL, params=params, timeout=self.timeout)
+        res.raise_for_status()
+        data = res.json()
+        return [result["title"].replace("Property:", "") for result in data["query"]["search"]]
+
+    def _get_backoff(self, attempt):
+        """Time to wait (in seconds) before retrying the failed attempt."""
+        return min(SEARCH_BACKOFF * 2 ** attempt, SEARCH_MAX_BACKOFF)
+
+    def search_term(self, term, offset=None, number_of_results=None):
         """ Search for the given term. """
-        if recursion_depth == 5:
-            WikidataSearch._search_exception(term)
-            return []
         # try with cache
-        if self.cache and not (self.cache.get(term) is None):
+        if self.cache:
             result = self.cache.get(term)
-            return result
+            if not result is None:
+                return result
         # retrieve new
-        try:
-            self.params["srnamespace"] = "0|120"
-            self.params["srsearch"] = term
-            if offset:
-                self.params["sroffset"] = offset
-            res = self.SESSION.get(url=self.URL, params=self.params)
-            data = res.json()
-            result = [result["title"].replace("Property:", "") for result in data["query"]["search"]]
+        if number_of_results is None:
+            number_of_results = self.results_per_search
+        result = self._request(self._get_params(term, number_of_results, offset=offset))
+        if result is None:
+            WikidataSearch._search_exception(term)
+            return []
+        if self.cache:
             self.cache.store(term, result)
-            return result
-        except:
-            time.sleep(0.5)
-            recursion_depth += 1
-            return self.search_term(term, offset=offset, recursion_depth=recursion_depth)
+        return result
+
+    async def asearch_term(self, term, offset=None, number_of_results=None, executor=None):
+        """
+        Search for the given term (for use within asyncio): the requests are awaited,
+        the cache lookups run in the executor (the default executor if None).
+        """
+        loop = asyncio.get_running_loop()
+        # try with cache
+        if self.cache:
+            result = await loop.run_in_executor(executor, self.cache.get, term)
+            if not result is None:
+                return result
+        # retrieve new
+        if number_of_results is None:
+            number_of_results = self.results_per_search
+        result = await self._arequest(self._get_params(term, number_of_results, offset=offset))
+        if result is None:
+            WikidataSearch._search_exception(term)
+            return []
+        if self.cache:
+            await loop.run_in_executor(executor, self.cache.store, term, result)
+        return result
 
     def _search_entities(self, term, num_results):
         """NOT IN USE. Searches for num_results entities."""
-        try:
-            self.params["srnamespace"] = "0"
-            self.params["srsearch"] = term
-            self.params["srlimit"] = num_results
-            res = self.SESSION.get(url=self.URL, params=self.params)
-            data = res.json()
-            result = [result["title"].replace("Property:", "") for result in data["query"]["search"]]
-            return result
-        except:
+        result = self._request(self._get_params(term, num_results, namespace="0"))
+        if result is None:
             print("Search exception for", term)
             return []
+        return result
 
     def _search_predicates(self, term, num_results):
         """NOT IN USE. Searches for num_results predicates."""
-        try:
-            self.params["srnamespace"] = "120"
-            self.params["srsearch"] = term
-            self.params["srlimit"] = num_results
-            res = self.SESSION.get(url=self.URL, params=self.params)
-            data = res.json()
-            result = [result["title"].replace("Property:", "") for result in data["query"]["search"]]
-            return result
-        except:
+        result = self._request(self._get_params(term, num_results, namespace="120"))
+        if result is None:
             print("Search exception for ", term)
             return []
+        return result
 
     @staticmethod
     def _search_exception(term):
@@ -80,26 +183,123 @@ class WikidataSearch:
 
 
 class CandidateList:
-    """Holds candidata KB items for the question term given, as given by the search engine."""
+    """
+    Holds candidata KB items for the question term given, as given by the search engine.
+    By default, the Wikidata search is used. Any search engine with the same
+    interface (e.g. LocalSearch) can be given instead.
+    If an alias table is given, exact matches of the question term are looked up first.
+    If a trigram index is given, it fills up the candidates in case the search engine
+    returns only few results (e.g. for misspelled question terms).
+    """
 
-    def __init__(self, question_term, kb, list_depth, wikidata_search_cache=None):
+    def __init__(
+        self,
+        question_term,
+        kb,
+        list_depth,
+        wikidata_search_cache=None,
+        search_engine=None,
+        alias_table=None,
+        trigram_index=None,
+        candidate_cache=None,
+    ):
         self.question_term = question_term
-        self.search_engine = WikidataSearch(results_per_search=2 * list_depth, cache=wikidata_search_cache)
+        if search_engine is None:
+            search_engine = WikidataSearch(results_per_search=2 * list_depth, cache=wikidata_search_cache)
+        self.search_engine = search_engine
+        self.alias_table = alias_table
+        self.trigram_index = trigram_index
+        # candidates of question terms, shared among questions (optional)
+        self.candidate_cache = candidate_cache
         self.kb = kb
         self.list_depth = list_depth
         # current positon of pointer: e.g. 10 after scanning 10 elements
         self.offset = 0
         # initialize list for candidates
         self.item_list = list()
+        self.initialized = False
 
     def initialize(self):
-        """Initialize the list with candidate KB items as given by the search engine."""
+        """
+        Initialize the list with candidate KB items as given by the search engine.
+        Exact matches in the alias table (if available) are used instead, if there are sufficiently many.
+        Typo-tolerant matches (if available) fill up the list, if there are only few.
+        With a candidate cache, the candidates are retrieved only once per question term and depth.
+        """
+        if self.candidate_cache is None:
+            self.item_list = self._retrieve_items()
+        else:
+            key = (self.question_term, self.list_depth)
+            found, item_list = self.candidate_cache.lookup(key)
+            if not found:
+                item_list = self._retrieve_items()
+                self.candidate_cache.store(key, item_list)
+            self.item_list = list(item_list)
+        self.initialized = True
+
+    async def ainitialize(self, executor=None):
+        """
+        Same as initialize, for use within asyncio: the search engine is awaited, the lookups
+        and the pruning of the candidates run in the executor (the default executor if None).
+        """
+        if self.candidate_cache is None:
+            self.item_list = await self._aretrieve_items(executor)
+        else:
+            key = (self.question_term, self.list_depth)
+            found, item_list = self.candidate_cache.lookup(key)
+            if not found:
+                item_list = await self._aretrieve_items(executor)
+                self.candidate_cache.store(key, item_list)
+            self.item_list = list(item_list)
+        self.initialized = True
+
+    def _retrieve_items(self):
+        """Retrieve the candidate KB items for the question term."""
+        item_list = self._lookup_aliases()
+        if item_list is not None:
+            return item_list
         # retrieve 2xd results
-        item_list = self.search_engine.search_term(self.question_term)
-        # prune items that are not in the KB (e.g. pruned, or not present in a different version)
+        item_list = self.search_engine.search_term(self.question_term, number_of_results=2 * self.list_depth)
+        return self._fill_up_items(item_list)
+
+    async def _aretrieve_items(self, executor=None):
+        """Same as _retrieve_items, for use within asyncio (only the search engine is awaited on the loop)."""
+        loop = asyncio.get_running_loop()
+        item_list = await loop.run_in_executor(executor, self._lookup_aliases)
+        if item_list is not None:
+            return item_list
+        # retrieve 2xd results
+        item_list = await self.search_engine.asearch_term(
+            self.question_term, number_of_results=2 * self.list_depth, executor=executor
+        )
+        return await loop.run_in_executor(executor, self._fill_up_items, item_list)
+
+    def _lookup_aliases(self):
+        """Returns the exact matches in the alias table, or None if there are only few (or no alias table)."""
+        if self.alias_table:
+            item_list = self.alias_table.lookup(self.question_term, number_of_results=2 * self.list_depth)
+            item_list = self._prune_items(item_list)
+            if len(item_list) >= self._get_min_candidates():
+                return item_list
+        return None
+
+    def _get_min_candidates(self):
+        """Number of candidates that are sufficient (the list is truncated to the depth)."""
+        return min(MIN_CANDIDATES, self.list_depth)
+
+    def _fill_up_items(self, item_list):
+        """Prune the results of the search engine, and fill them up with typo-tolerant matches (if only few)."""
+        item_list = self._prune_items(item_list)
+        if self.trigram_index and len(item_list) < self._get_min_candidates():
+            fuzzy_item_list = self.trigram_index.search_term(self.question_term, number_of_results=2 * self.list_depth)
+            item_list += [item for item in fuzzy_item_list if not item in item_list]
+            item_list = self._prune_items(item_list)
+        return item_list
+
+    def _prune_items(self, item_list):
+        """Prune items that are not in the KB (e.g. pruned, or not present in a different version), and keep the top-d."""
         item_list = [item for item in item_list if self.kb.is_known(item)]
-        item_list = item_list[: self.list_depth]
-        self.item_list = item_list
+        return item_list[: self.list_depth]
 
     def scan(self):
         """Return next candidate KB item with score. Removes it from the list."""
@@ -110,6 +310,11 @@ class CandidateList:
         score = 1 / (self.offset + 1)
         return item, score
 
+    def truncate(self, list_depth):
+        """Keep only the first list_depth candidate KB items."""
+        self.list_depth = list_depth
+        self.item_list = self.item_list[:list_depth]
+
     def get_items(self):
         """Return full list of candidate KB items."""
         return self.item_list
@@ -1,27 +1,22 @@
-import json
-import threading
+from clocq.PersistentCache import PersistentCache
 
 
 class WikidataSearchCache:
-    def __init__(self, path_to_wiki_search_cache):
-        self.lock = threading.Lock()
-        self.cache_changed = False
+    def __init__(self, path_to_wiki_search_cache, max_entries=None):
         self.path_to_wiki_search_cache = path_to_wiki_search_cache
+        self.max_entries = max_entries
         self._initialize_cache()
 
     def _initialize_cache(self):
-        """Initialize cache."""
-        if self.path_to_wiki_search_cache:
-            with open(self.path_to_wiki_search_cache, "r") as file:
-                self.cache = json.load(file)
-        else:
-            self.cache = dict()
+        """
+        Initialize cache. Entries are written to disk incrementally (if a path is given),
+        a JSON cache of previous versions is imported once.
+        """
+        self.cache = PersistentCache.open(self.path_to_wiki_search_cache, max_entries=self.max_entries)
 
     def store_cache(self):
-        """Store the cache to disk."""
-        if self.path_to_wiki_search_cache and self.cache_changed:
-            with open(self.path_to_wiki_search_cache, "w") as fp:
-                json.dump(self.cache, fp)
+        """Store the cache to disk (entries are already persisted on store)."""
+        self.cache.flush()
 
     def get(self, question_term):
         """Retrieve results for the question_term from the cache."""
@@ -29,12 +24,12 @@ class WikidataSearchCache:
         # signal no cache hit
         if not res:
             return None
-        # copy object and return
-        return res.copy()
+        return res
 
     def store(self, question_term, sorted_items):
         """Store the entry in the cache."""
-        self.lock.acquire()
-        self.cache[question_term] = sorted_items.copy()
-        self.cache_changed = True
-        self.lock.release()
+        self.cache.store(question_term, sorted_items)
+
+    def get_statistics(self):
+        """Returns the hits, misses, hit ratio and size of the cache."""
+        return self.cache.get_statistics()
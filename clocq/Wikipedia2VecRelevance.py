@@ -1,76 +1,119 @@
 import json
+import os
 import re
+import threading
 import time
 
 import numpy as np
 from wikipedia2vec import Wikipedia2Vec
 
+from clocq.EmbeddingStore import EmbeddingStore
+from clocq.LRUCache import LRUCache
+from clocq.MemoryMappedWikipedia2Vec import MemoryMappedWikipedia2Vec
+from clocq.Tokenizer import Tokenizer
+
 
 class Wikipedia2VecRelevance:
     def __init__(
-        self, kb, path_to_stopwords, path_to_wiki2vec_model, path_to_wikipedia_mappings, path_to_norm_cache=None
+        self,
+        kb,
+        path_to_stopwords,
+        path_to_wiki2vec_model,
+        path_to_wikipedia_mappings,
+        path_to_embedding_store=None,
+        phrase_cache_size=100000,
     ):
         self.kb = kb
-        self.wiki2vec = Wikipedia2Vec.load(path_to_wiki2vec_model)
+        # the model is loaded on first use
+        self.path_to_wiki2vec_model = path_to_wiki2vec_model
+        self.wiki2vec_model = None
+        self.wiki2vec_lock = threading.Lock()
         # define regular expressions
         self.ENT_PATTERN = re.compile("^Q[0-9]+$")
         self.PRE_PATTERN = re.compile("^P[0-9]+$")
         # load stopwords
-        with open(path_to_stopwords, "r") as file:
-            self.stopwords = file.read().split("\n")
+        self.tokenizer = Tokenizer(path_to_stopwords)
         # load mappings (wikidata->wikipedia)
         with open(path_to_wikipedia_mappings, "r") as file:
             self.wikipedia_mappings = json.load(file)
-        # initialize cache for vector norms
-        self.path_to_norm_cache = path_to_norm_cache
-        self._initialize_norm_cache()
-        self.cache_changed = False
-
-    def _initialize_norm_cache(self):
-        """Initialize the vector norm cache."""
-        if self.path_to_norm_cache:
-            with open(self.path_to_norm_cache, "r") as fp:
-                self.norm_cache = json.load(fp)
-        else:
-            self.norm_cache = dict()
-
-    def store_norm_cache(self):
-        """Store the cache for vector norms on disk."""
-        if self.path_to_norm_cache and self.cache_changed:
-            with open(self.path_to_norm_cache, "w") as fp:
-                fp.write(json.dumps(self.norm_cache))
-
-    def cosine_similarity(self, vector1, vector2, string1, string2, norm1=False, norm2=False):
-        """Compute the cosine similarity between the two vectors."""
-        if norm1 and norm2:
-            sim = np.dot(vector1, vector2) / (norm1 * norm2)
+        # load precomputed embeddings of KB items (if available)
+        if path_to_embedding_store and os.path.exists(path_to_embedding_store):
+            self.embedding_store = EmbeddingStore(kb, path_to_embedding_store)
         else:
-            sim = np.dot(vector1, vector2) / (self.norm(string1, vector1) * self.norm(string2, vector2))
-        return sim
+            self.embedding_store = None
+        # cache for embeddings of phrases (predicate labels, question words,...)
+        self.phrase_cache = LRUCache(phrase_cache_size)
 
-    def norm(self, string, vector):
-        """Compute (or retrieve from cache) the vector norm."""
+    @property
+    def wiki2vec(self):
+        """
+        The Wikipedia2Vec model, loaded on first use. The memory-mappable layout
+        of the model is used if available (see MemoryMappedWikipedia2Vec).
+        """
+        if self.wiki2vec_model is None:
+            with self.wiki2vec_lock:
+                if self.wiki2vec_model is None:
+                    path_to_directory = MemoryMappedWikipedia2Vec.get_directory(self.path_to_wiki2vec_model)
+                    if os.path.isdir(path_to_directory):
+                        self.wiki2vec_model = MemoryMappedWikipedia2Vec(path_to_directory)
+                    else:
+                        self.wiki2vec_model = Wikipedia2Vec.load(self.path_to_wiki2vec_model)
+        return self.wiki2vec_model
+
+    def cosine_similarity(self, vector1, vector2):
+        """
+        Compute the cosine similarity between the two vectors.
+        All embeddings are unit-normalized, so this is the dot product.
+        """
+        return np.dot(vector1, vector2)
+
+    def cosine_similarity_matrix(self, matrix1, matrix2):
+        """
+        Compute the cosine similarities among the rows of the two matrices
+        (of unit-normalized vectors) with a single matrix multiplication.
+        Zero rows (no embedding) obtain a similarity of 0. The products are accumulated in float64,
+        so that the similarity of a pair does not depend on the shapes of the matrices
+        (e.g. full blocks, or single rows in lazy scoring).
+        """
+        return np.matmul(matrix1.astype(np.float64), matrix2.T.astype(np.float64)).astype(np.float32)
+
+    def _normalize(self, vector):
+        """Scale the vector to unit length (None if there is no embedding)."""
         if vector is None:
             return None
-        # retrieve vector norm from cache
-        cached = self.norm_cache.get(string)
-        if cached is None:
-            vector_norm = np.linalg.norm(vector)
-            # store norm in cache
-            self.norm_cache[string] = str(vector_norm)
-            self.cache_changed = True
-            return vector_norm
-        else:
-            return float(cached)
+        vector_norm = np.linalg.norm(vector)
+        if not vector_norm:
+            return None
+        return (vector / vector_norm).astype(np.float32)
 
     def embed_kb_item(self, kb_item):
-        """Retrieve embedding for Wikidata ID."""
+        """Retrieve unit-normalized embedding for Wikidata ID (from the embedding store, if available)."""
+        if self.embedding_store is not None:
+            found, vector = self.embedding_store.lookup(kb_item)
+            if found:
+                return vector
+        return self.compute_kb_item_embedding(kb_item)
+
+    def embed_kb_items(self, kb_items):
+        """
+        Embed the KB items into a (number of items x dimension) matrix
+        of unit-normalized vectors. Rows of KB items without embedding are zero.
+        """
+        matrix = np.zeros((len(kb_items), self.get_dimension()), dtype=np.float32)
+        for i, kb_item in enumerate(kb_items):
+            vector = self.embed_kb_item(kb_item)
+            if vector is not None:
+                matrix[i] = vector
+        return matrix
+
+    def compute_kb_item_embedding(self, kb_item):
+        """Compute embedding for Wikidata ID (used for creating the embedding store)."""
         if self._is_entity(kb_item):
             wikipedia_name = self.entity_to_wikipedia_name(kb_item)
             if wikipedia_name:
                 try:
                     vector = self.wiki2vec.get_entity_vector(wikipedia_name)
-                    return vector
+                    return self._normalize(vector)
                 except:
                     pass
             label = self.kb.item_to_single_label(kb_item)
@@ -92,11 +135,23 @@ class Wikipedia2VecRelevance:
         return vector
 
     def embed_phrase(self, phrase):
-        """Embed the given phrase into latent space."""
+        """
+        Embed the given phrase into latent space (unit-normalized).
+        Embeddings are cached, and must not be modified by the caller.
+        """
         phrase = phrase.lower()
-        words = phrase.split()
-        # remove stopwords
-        words = [word for word in words if not word in self.stopwords]
+        found, vector = self.phrase_cache.lookup(phrase)
+        if found:
+            return vector
+        vector = self._compute_phrase_embedding(phrase)
+        if vector is not None:
+            vector.flags.writeable = False
+        self.phrase_cache.store(phrase, vector)
+        return vector
+
+    def _compute_phrase_embedding(self, phrase):
+        """Average the word vectors of the (non-stopword) words in the phrase."""
+        words = self.tokenizer.get_words(phrase)
         vectors = list()
         for word in words:
             try:
@@ -106,7 +161,13 @@ class Wikipedia2VecRelevance:
                 continue
         if len(vectors) == 0:
             return None
-        return np.mean(vectors, axis=0)
+        return self._normalize(np.mean(vectors, axis=0))
+
+    def get_dimension(self):
+        """Returns the dimension of the embeddings."""
+        if self.embedding_store is not None:
+            return self.embedding_store.matrix.shape[1]
+        return self.wiki2vec.syn0.shape[1]
 
     def matching(self, kb_item, question_term):
         """Compute the matching score between the kb_item and the question term."""
@@ -118,7 +179,7 @@ class Wikipedia2VecRelevance:
         vector2 = self.embed_kb_item(string2)
         if vector1 is None or vector2 is None:
             return 0
-        res = self.cosine_similarity(vector1, vector2, string1, string2)
+        res = self.cosine_similarity(vector1, vector2)
         return res
 
     def _is_entity(self, string):
@@ -151,10 +212,23 @@ class Wikipedia2VecRelevance:
             return 0
         score = 0
         for word, word_vector in other_question_words_vectors:
-            score += self.cosine_similarity(item_vector, word_vector, kb_item, word)
+            score += self.cosine_similarity(item_vector, word_vector)
         question_relevance = score / len(other_question_words_vectors)
         return question_relevance
 
+    def get_question_relevance_scores(self, kb_items, other_question_words_vectors):
+        """
+        Compute the relevance scores for all given KB items at once
+        (see get_question_relevance_score): one matrix product between the item
+        embeddings and the word vectors, averaged over the words.
+        KB items without embedding obtain a relevance score of 0.
+        """
+        if not len(kb_items) or not len(other_question_words_vectors):
+            return np.zeros(len(kb_items))
+        items_matrix = self.embed_kb_items(kb_items)
+        words_matrix = np.stack([word_vector for _, word_vector in other_question_words_vectors])
+        return self.cosine_similarity_matrix(items_matrix, words_matrix).mean(axis=1)
+
     def get_word_vectors(self, other_question_words):
         """
         Get word vectors of all question words given.
@@ -51,9 +51,28 @@ BENCHMARKS = [
     ("benchmarks/ConvQuestions_FQ.json", "convquestionsfq")
 ]
 
+# batched NER (spaCy/stanza) for multiple questions (e.g. benchmarks, task lists)
+NER_BATCH_SIZE = 64
+NER_PROCESSES = 1  # worker processes (spaCy only)
+
+# worker processes for the connectivity and coherence computations (0: threads within the process)
+# the workers are forked once the KB is loaded (Linux only), and share its memory copy-on-write:
+# garbage collection is kept away from the shared objects (gc.freeze), but reference counting
+# still copies the pages of the KB objects used by a worker, i.e. the resident memory can grow
+# by up to the size of the KB per worker over time
+NUMBER_OF_PROCESSES = 0
+
+# endpoint of the Wikidata search (e.g. a mirror, or a local stub server for testing)
+WIKIDATA_SEARCH_URL = "https://www.wikidata.org/w/api.php"
+
 # settings for CLOCQ server
 HOST = "localhost"
 PORT = 7778
+# search space results kept in memory by the server (0: no caching);
+# a single result can take several MB, so only small sizes (e.g. 100) should be used
+RESULT_CACHE_SIZE = 0
+# cache the connectivity checks of the KB (unbounded), its hit ratio is exported by the server
+USE_CONNECTIVITY_CACHE = False
 
 
 """
@@ -74,13 +93,32 @@ PATH_TO_STOPWORDS = os.path.join(PATH_TO_DATA_FOLDER, "stopwords.txt")
 
 # wikipedia2VecRelevance paths
 PATH_TO_WIKI2VEC_MODEL = os.path.join(PATH_TO_DATA_FOLDER, "enwiki_20180420_300d.pkl")
+# the memory-mappable layout of the model (data/enwiki_20180420_300d_mmap) is used if it exists
+# create via: python -m clocq.MemoryMappedWikipedia2Vec
 PATH_TO_WIKIPEDIA_MAPPINGS = os.path.join(PATH_TO_DATA_FOLDER, "kb", "dicts", "wikipedia_mappings.json")
 PATH_TO_WIKIDATA_MAPPINGS = os.path.join(PATH_TO_DATA_FOLDER, "kb", "dicts", "wikidata_mappings.json")
+# precomputed (unit-normalized) KB item embeddings (used if the file exists)
+# create via: python -m clocq.EmbeddingStore [float32|float16|int8] (4, 2 or 1 byte(s) per dimension)
+PATH_TO_EMBEDDING_STORE = os.path.join(PATH_TO_DATA_FOLDER, "kb", "kb_embeddings_normalized.npy")
+
+# local search index for candidate KB items (used instead of the Wikidata search if it exists)
+# create via: python -m clocq.LocalSearch (requires the full KB)
+PATH_TO_LOCAL_SEARCH_INDEX = os.path.join(PATH_TO_DATA_FOLDER, "kb", "local_search")
+# exact-match table for candidate KB items (normalized label/alias -> KB items, consulted before the search)
+# create via: python -m clocq.AliasTable (requires the full KB)
+PATH_TO_ALIAS_TABLE = os.path.join(PATH_TO_DATA_FOLDER, "kb", "alias_table")
+# typo-tolerant search for candidate KB items (trigram index over the alias table)
+# create via: python -m clocq.TrigramIndex (requires the alias table)
+PATH_TO_TRIGRAM_INDEX = os.path.join(PATH_TO_DATA_FOLDER, "kb", "trigram_index")
 
 # paths to caches (set to None to drop)
-PATH_TO_NORM_CACHE = os.path.join(PATH_TO_DATA_FOLDER, "cache", "norm_cache.json")
-PATH_TO_WIKI_SEARCH_CACHE = os.path.join(PATH_TO_DATA_FOLDER, "cache", "wikidata_search_cache.json")
-PATH_TO_TAGME_NER_CACHE = os.path.join(PATH_TO_DATA_FOLDER, "cache", "tagme_ner_cache.json")
+# entries are written incrementally (SQLite), existing JSON caches with the same name are imported once
+# compact via: python -m clocq.PersistentCache
+PATH_TO_WIKI_SEARCH_CACHE = os.path.join(PATH_TO_DATA_FOLDER, "cache", "wikidata_search_cache.db")
+PATH_TO_TAGME_NER_CACHE = os.path.join(PATH_TO_DATA_FOLDER, "cache", "tagme_ner_cache.db")
+
+# log for the timings of requests with the "timings" parameter set (one JSON object per line; set to None to drop)
+PATH_TO_TIMINGS_LOG = os.path.join(PATH_TO_DATA_FOLDER, "logs", "timings.jsonl")
 
 
 """
@@ -97,4 +135,7 @@ DEF_PARAMS = {
     "k": "AUTO",
     "p_setting": 1000,
     "bm25_limit": False,
+    "deadline_ms": None,
+    "lazy": False,
+    "timings": False,
 }
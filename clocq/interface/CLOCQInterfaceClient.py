@@ -191,6 +191,18 @@ class CLOCQInterfaceClient:
 		result = json.loads(json_string)
 		return result
 
+	def get_search_spaces(self, questions, parameters=dict(), include_labels=True, include_type=False):
+		"""
+		Extract question-specific contexts for a list of questions using the CLOCQ algorithm.
+		Returns one result per question (in the same order), as given by get_search_space.
+		Work is shared among the questions, which is faster than individual requests.
+		"""
+		params = {"questions": questions, "parameters": parameters, "include_labels": include_labels, "include_type": include_type}
+		res = self._req("/search_space_batch", params)
+		json_string = res.content.decode("utf-8")
+		result = json.loads(json_string)
+		return result
+
 	def is_wikidata_entity(self, string):
 		"""
 		Check whether the given string can be a wikidata entity.
@@ -1,16 +1,18 @@
 import datetime
 import json
 import os
-import copy
 import sys
 import time
 
-from flask import Flask, jsonify, render_template, request, session
+from flask import Flask, Response, g, jsonify, render_template, request, session
 
 from clocq import config
 
+from clocq.CLOCQ import CLOCQ
 from clocq.CLOCQAlgorithm import CLOCQAlgorithm
 from clocq.knowledge_base.KnowledgeBase import KnowledgeBase
+from clocq.LRUCache import LRUCache
+from clocq.Metrics import LATENCY_BUCKETS, Metrics, get_resident_memory
 from clocq.StringLibrary import StringLibrary
 from clocq.WikidataSearchCache import WikidataSearchCache
 
@@ -20,10 +22,15 @@ app = Flask(__name__)
 app.secret_key = os.urandom(32)
 app.permanent_session_lifetime = datetime.timedelta(days=365)
 
+"""Metrics (exported via /metrics)"""
+metrics = Metrics()
+
 """Load modules"""
 string_lib = StringLibrary(config.PATH_TO_STOPWORDS, config.TAGME_TOKEN, config.PATH_TO_TAGME_NER_CACHE)
 wikidata_search_cache = WikidataSearchCache(config.PATH_TO_WIKI_SEARCH_CACHE)
-kb = KnowledgeBase(config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS)
+kb = KnowledgeBase(
+    config.PATH_TO_KB_LIST, config.PATH_TO_KB_DICTS, use_connectivity_cache=config.USE_CONNECTIVITY_CACHE
+)
 
 """Initialize CLOCQ"""
 method_name = "clocq_server"
@@ -35,9 +42,63 @@ clocq = CLOCQAlgorithm(
     config.PATH_TO_STOPWORDS,
     config.PATH_TO_WIKI2VEC_MODEL,
     config.PATH_TO_WIKIPEDIA_MAPPINGS,
-    config.PATH_TO_NORM_CACHE,
     wikidata_search_cache=wikidata_search_cache,
+    path_to_embedding_store=config.PATH_TO_EMBEDDING_STORE,
+    path_to_local_search_index=config.PATH_TO_LOCAL_SEARCH_INDEX,
+    path_to_alias_table=config.PATH_TO_ALIAS_TABLE,
+    path_to_trigram_index=config.PATH_TO_TRIGRAM_INDEX,
+    wikidata_search_url=config.WIKIDATA_SEARCH_URL,
+    number_of_processes=config.NUMBER_OF_PROCESSES,
+    path_to_timings_log=config.PATH_TO_TIMINGS_LOG,
+    metrics=metrics,
 )					  
+# results of search space requests (only deterministic results are cached, if enabled)
+result_cache = LRUCache(config.RESULT_CACHE_SIZE) if config.RESULT_CACHE_SIZE else None
+
+
+"""Metrics of requests and caches"""
+def get_cache_metrics(statistic):
+    """Returns the given statistic (e.g. hits) for all caches, as (labels, value)-tuples."""
+    cache_statistics = clocq.get_cache_statistics()
+    if result_cache:
+        cache_statistics["result"] = result_cache.get_statistics()
+    return [
+        ({"cache": cache}, statistics[statistic])
+        for cache, statistics in cache_statistics.items()
+        if statistic in statistics
+    ]
+
+
+metrics.counter("clocq_requests_total", "Requests (by route, method and status).")
+metrics.histogram("clocq_request_seconds", "Latency of requests (by route).", LATENCY_BUCKETS)
+metrics.gauge("clocq_requests_in_flight", "Requests currently processed.")
+metrics.gauge("process_resident_memory_bytes", "Resident memory of the process.", lambda: [({}, get_resident_memory())])
+metrics.counter("clocq_cache_hits_total", "Hits of the caches.", lambda: get_cache_metrics("hits"))
+metrics.counter("clocq_cache_misses_total", "Misses of the caches.", lambda: get_cache_metrics("misses"))
+metrics.gauge("clocq_cache_hit_ratio", "Hit ratio of the caches.", lambda: get_cache_metrics("hit_ratio"))
+metrics.gauge("clocq_cache_size", "Entries in the caches.", lambda: get_cache_metrics("size"))
+
+
+@app.before_request
+def start_request():
+    g.start = time.time()
+    metrics.increment("clocq_requests_in_flight")
+
+
+@app.after_request
+def record_request(response):
+    # unknown routes are not distinguished (to bound the number of labels)
+    route = request.url_rule.rule if request.url_rule else "unknown"
+    metrics.increment("clocq_requests_total", route=route, method=request.method, status=response.status_code)
+    metrics.observe("clocq_request_seconds", time.time() - g.start, route=route)
+    return response
+
+
+@app.teardown_request
+def end_request(exception=None):
+    if "start" in g:
+        metrics.increment("clocq_requests_in_flight", -1)
+
 
 """Routes"""
 @app.route("/test", methods=["GET"])
@@ -45,6 +106,11 @@ def test():
     return "Test successful!"
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/neighborhood", methods=["POST"])
 def neighborhood():
     json_dict = request.json
@@ -187,14 +253,7 @@ def search_space():
     if question is None:
         return None
     # load parameters
-    parameters = json_dict.get("parameters")
-    if parameters is None:
-        parameters = copy.deepcopy(config.DEF_PARAMS)
-    else:
-        new_parameters = copy.deepcopy(config.DEF_PARAMS)
-        for key in parameters:
-            new_parameters[key] = parameters[key]
-        parameters = new_parameters
+    parameters = CLOCQ.merge_parameters(json_dict.get("parameters"))
     # load p and k (potentially)
     if "p" in json_dict:
         parameters["p_setting"] = json_dict["p"]
@@ -202,6 +261,9 @@ def search_space():
         parameters["p_setting"] = json_dict["p_setting"]
     if "k" in json_dict:
         parameters["k"] = json_dict["k"]
+    # load latency budget (potentially)
+    if "deadline_ms" in json_dict:
+        parameters["deadline_ms"] = json_dict["deadline_ms"]
     # include labels of search space?
     include_labels = json_dict.get("include_labels")
     if include_labels is None:
@@ -210,10 +272,49 @@ def search_space():
     include_type = json_dict.get("include_type")
     if include_type is None:
         include_type = False
+    # results with a latency budget or timings depend on the load, and are not cached
+    cacheable = result_cache and not parameters.get("deadline_ms") and not parameters.get("timings")
+    if cacheable:
+        key = json.dumps([question, parameters, include_labels, include_type], sort_keys=True)
+        found, result = result_cache.lookup(key)
+        if found:
+            return jsonify(result)
     # compute result (search space and disambiguation results)
     result = clocq.get_seach_space(question, parameters=parameters, include_labels=include_labels, include_type=include_type)
+    if cacheable:
+        result_cache.store(key, result)
     return jsonify(result)
 
 
+@app.route("/search_space_batch", methods=["POST"])
+def search_space_batch():
+    json_dict = request.json
+    # load questions
+    questions = json_dict.get("questions")
+    if questions is None:
+        return jsonify([])
+    # load parameters
+    parameters = CLOCQ.merge_parameters(json_dict.get("parameters"))
+    # include labels of search space?
+    include_labels = json_dict.get("include_labels")
+    if include_labels is None:
+        include_labels = True
+    # include most freq type for each item in search space?
+    include_type = json_dict.get("include_type")
+    if include_type is None:
+        include_type = False
+    # compute results (search space and disambiguation results for each question,
+    # the question words are extracted in batches)
+    results = clocq.get_search_spaces(
+        questions,
+        parameters=parameters,
+        include_labels=include_labels,
+        include_type=include_type,
+        ner_batch_size=config.NER_BATCH_SIZE,
+        ner_processes=config.NER_PROCESSES,
+    )
+    return jsonify(results)
+
+
 if __name__ == "__main__":
     app.run(host=config.HOST, port=config.PORT, threaded=True)
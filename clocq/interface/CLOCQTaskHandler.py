@@ -13,6 +13,10 @@ class CLOCQTaskHandler:
 		"""
 		with open(input_path, "r") as fp:
 			tasks = json.load(fp)
+		# extract question words for all questions in batches
+		questions = [task["question"] for task in tasks if task.get("task") == "get_search_space" and task.get("question")]
+		if questions:
+			self.clocq.precompute_question_words(questions)
 		# process tasks
 		with open(output_path, "a") as output_file:
 			for task in tasks:
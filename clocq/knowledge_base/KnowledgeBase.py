@@ -57,6 +57,8 @@ class KnowledgeBase:
         self._load_KB_index_from_file(path_to_kb_list, max_items)
         # initialize runtime cache for connectivity
         self.connectivity_cache = dict()
+        self.connectivity_cache_hits = 0
+        self.connectivity_cache_misses = 0
 
     def _is_entity(self, integer_encoded_item):
         """Return whether encoded item is entity."""
@@ -109,6 +111,18 @@ class KnowledgeBase:
             "12": "December",
         }[number]
 
+    def item_to_integer(self, item):
+        """
+        Retrieve the integer encoding of the KB-item (None if not in the KB).
+        Entities and predicates are encoded by positive integers below HIGHEST_ID,
+        literals by negative integers.
+        """
+        return self._item_to_integer(item)
+
+    def integer_to_item(self, integer_encoded_item):
+        """Retrieve the KB-item for the integer encoding."""
+        return self._integer_to_item(integer_encoded_item)
+
     def _item_to_integer(self, item):
         """Encode the KB-item."""
         try:
@@ -300,9 +314,12 @@ class KnowledgeBase:
         # check cache
         if self.use_connectivity_cache:
             if self.connectivity_cache.get((item1, item2)):
+                self.connectivity_cache_hits += 1
                 return self.connectivity_cache.get((item1, item2))
             elif self.connectivity_cache.get((item2, item1)):
+                self.connectivity_cache_hits += 1
                 return self.connectivity_cache.get((item2, item1))
+            self.connectivity_cache_misses += 1
         # no hit in cache, compute!
         integer_encoded_item1 = self._item_to_integer(item1)
         integer_encoded_item2 = self._item_to_integer(item2)
@@ -314,6 +331,17 @@ class KnowledgeBase:
             self.connectivity_cache[(item1, item2)] = connectivity
         return connectivity
 
+    def get_connectivity_cache_statistics(self):
+        """Returns the hits, misses, hit ratio and size of the connectivity cache (same as LRUCache)."""
+        lookups = self.connectivity_cache_hits + self.connectivity_cache_misses
+        return {
+            "hits": self.connectivity_cache_hits,
+            "misses": self.connectivity_cache_misses,
+            "hit_ratio": self.connectivity_cache_hits / lookups if lookups else 0,
+            "size": len(self.connectivity_cache),
+            "maxsize": None,
+        }
+
     def _connectivity_check_integers(self, integer_encoded_item1, integer_encoded_item2):
         """Check connectivity between the two encoded items."""
         neighbors1 = self._get_neighbors(integer_encoded_item1)
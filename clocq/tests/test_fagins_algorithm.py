@@ -0,0 +1,23 @@
+from clocq.FaginsAlgorithm import FaginsAlgorithm, FaginsThresholdAlgorithm
+
+
+def test_items_seen_again_are_shared_once():
+    # A is seen again in the first queue after it was seen in all queues:
+    # FA must still continue until two distinct items are shared (A and B)
+    queue1 = [("A", 1), ("A", 0.9), ("B", 0.8), ("C", 0.1)]
+    queue2 = [("A", 1), ("C", 0.9), ("B", 0.5), ("A", 0.1)]
+    top_k = FaginsAlgorithm().apply([queue1, queue2], (0.5, 0.5), k=2)
+    assert [item["id"] for item in top_k] == ["A", "B"]
+
+
+def test_fagins_algorithm_equals_threshold_algorithm():
+    queue1 = [("A", 0.9), ("B", 0.8), ("C", 0.3), ("D", 0.2)]
+    queue2 = [("C", 1), ("D", 0.7), ("B", 0.4), ("A", 0.1)]
+    queue3 = [("D", 0.6), ("A", 0.5), ("C", 0.2), ("B", 0)]
+    hyperparameters = (0.5, 0.3, 0.2)
+    for k in range(1, 5):
+        top_k = FaginsAlgorithm(score_names=("s1", "s2", "s3")).apply([queue1, queue2, queue3], hyperparameters, k)
+        threshold_top_k = FaginsThresholdAlgorithm(score_names=("s1", "s2", "s3")).apply(
+            [queue1, queue2, queue3], hyperparameters, k
+        )
+        assert [item["id"] for item in top_k] == [item["id"] for item in threshold_top_k]
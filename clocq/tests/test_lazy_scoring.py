@@ -0,0 +1,150 @@
+import random
+
+import numpy as np
+import pytest
+
+from clocq.CoherenceGraph import CoherenceGraph, CoherenceScoreProcessor
+from clocq.ConnectivityGraph import ConnectivityGraph, ConnectivityScoreProcessor
+from clocq.LazyScoreProcessor import LazyScoreProcessor
+from clocq.TopkProcessor import TopkProcessor
+from clocq.Wikipedia2VecRelevance import Wikipedia2VecRelevance
+
+# few distinct values, so that ties (and scores of 1.0) are frequent
+CONNECTIVITY_VALUES = (0, 0, 0.5, 1)
+RELEVANCE_VALUES = (0, 0.25, 0.5, 1)
+NUMBER_OF_VECTORS = 4
+DIMENSION = 8
+
+CONFIGURATIONS = [
+    ((0.4, 0.3, 0.2, 0.1), "AUTO"),
+    ((0.4, 0.3, 0.2, 0.1), 1),
+    ((0.25, 0.25, 0.25, 0.25), 3),
+    ((0.1, 0.1, 0.4, 0.4), 5),
+    ((0.0, 0.0, 0.5, 0.5), 2),
+    ((1.0, 0.0, 0.0, 0.0), 4),
+]
+
+
+class RandomKB:
+    """KB with random (symmetric) connectivity and frequencies among the KB items."""
+
+    def __init__(self, rng, items):
+        self.connectivity = dict()
+        for item1 in items:
+            for item2 in items:
+                key = (item1, item2) if item1 <= item2 else (item2, item1)
+                if not key in self.connectivity:
+                    self.connectivity[key] = rng.choice(CONNECTIVITY_VALUES)
+        self.frequencies = {item: rng.randint(0, 100) for item in items}
+
+    def is_known(self, item):
+        return True
+
+    def connectivity_check(self, item1, item2):
+        return self.connectivity[(item1, item2) if item1 <= item2 else (item2, item1)]
+
+    def get_frequency(self, item):
+        return [self.frequencies[item], 0]
+
+
+class RandomSearch:
+    """Search engine returning the given candidates for each question word."""
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+
+    def search_term(self, term, number_of_results=None):
+        return list(self.candidates[term])
+
+
+class RandomWikipedia2Vec:
+    """Random relevance scores, and embeddings taken from a small set of vectors (or none)."""
+
+    def __init__(self, rng, items):
+        self.relevance = {item: rng.choice(RELEVANCE_VALUES) for item in items}
+        vectors = np.random.default_rng(rng.randint(0, 2 ** 32)).normal(size=(NUMBER_OF_VECTORS, DIMENSION))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = dict()
+        for item in items:
+            index = rng.randint(0, NUMBER_OF_VECTORS)
+            self.vectors[item] = np.zeros(DIMENSION) if index == NUMBER_OF_VECTORS else vectors[index]
+
+    def get_word_vectors(self, words):
+        return None
+
+    def get_question_relevance_scores(self, items, word_vectors):
+        return np.array([self.relevance[item] for item in items])
+
+    def embed_kb_items(self, items):
+        return np.array([self.vectors[item] for item in items], dtype=np.float32).reshape(-1, DIMENSION)
+
+    cosine_similarity_matrix = Wikipedia2VecRelevance.cosine_similarity_matrix
+
+
+def _create_topk_processors(kb, wiki2vec, search, question_words, d):
+    connectivity_graph = ConnectivityGraph(len(question_words), d)
+    coherence_graph = CoherenceGraph(len(question_words), d)
+    topk_processors = list()
+    for question_word_index in range(len(question_words)):
+        topk_processor = TopkProcessor(
+            kb,
+            wiki2vec,
+            connectivity_graph,
+            coherence_graph,
+            question_word_index,
+            question_words,
+            d=d,
+            search_engine=search,
+        )
+        topk_processor.initialize_candidates()
+        topk_processors.append(topk_processor)
+    return topk_processors, connectivity_graph, coherence_graph
+
+
+def _get_top_ks(topk_processors):
+    return [
+        [topk_processor.get_top_k(i) for i in range(len(CONFIGURATIONS))] for topk_processor in topk_processors
+    ]
+
+
+# seed 1667: coherence scores of blocks and single rows differed in float32 (rounded to 0.3492 vs. 0.3493)
+@pytest.mark.parametrize("seed", list(range(200)) + [1667])
+def test_lazy_scoring_equals_eager_scoring(seed):
+    rng = random.Random(seed)
+    number_of_question_words = rng.randint(1, 4)
+    d = rng.randint(1, 8)
+    items = [f"Q{i}" for i in range(12)]
+    question_words = [f"word{i}" for i in range(number_of_question_words)]
+    # candidates can be shared among question words
+    search = RandomSearch({word: rng.sample(items, rng.randint(0, d)) for word in question_words})
+    kb = RandomKB(rng, items)
+    wiki2vec = RandomWikipedia2Vec(rng, items)
+
+    # eager: all connectivity and coherence scores are established before the top-k are computed
+    topk_processors, connectivity_graph, coherence_graph = _create_topk_processors(
+        kb, wiki2vec, search, question_words, d
+    )
+    for index1 in range(number_of_question_words):
+        for index2 in range(index1 + 1, number_of_question_words):
+            candidates1 = topk_processors[index1].get_candidates()
+            candidates2 = topk_processors[index2].get_candidates()
+            ConnectivityScoreProcessor(kb, connectivity_graph).process(index1, index2, candidates1, candidates2)
+            CoherenceScoreProcessor(wiki2vec, coherence_graph).process(index1, index2, candidates1, candidates2)
+    for topk_processor in topk_processors:
+        topk_processor.compute_top_k_configurations(CONFIGURATIONS, connectivity_graph, coherence_graph)
+    eager_top_ks = _get_top_ks(topk_processors)
+
+    # lazy: scores are established on demand
+    topk_processors, connectivity_graph, coherence_graph = _create_topk_processors(
+        kb, wiki2vec, search, question_words, d
+    )
+    lazy_processor = LazyScoreProcessor(
+        [topk_processor.get_candidates()[:] for topk_processor in topk_processors],
+        ConnectivityScoreProcessor(kb, connectivity_graph),
+        CoherenceScoreProcessor(wiki2vec, coherence_graph),
+    )
+    for topk_processor in topk_processors:
+        topk_processor.compute_top_k_lazy(CONFIGURATIONS, lazy_processor)
+    lazy_top_ks = _get_top_ks(topk_processors)
+
+    assert lazy_top_ks == eager_top_ks
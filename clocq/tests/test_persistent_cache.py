@@ -0,0 +1,36 @@
+import json
+
+from clocq.PersistentCache import PersistentCache
+
+
+def test_hits_are_served_from_memory(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.db"), memory_cache_size=2)
+    cache.store("a", ["Q1"])
+    cache.store("b", ["Q2"])
+    cache.store("c", ["Q3"])
+    # "a" was dropped from memory, and is read through from the database
+    assert not "a" in cache.memory_cache
+    assert cache.get("a") == ["Q1"]
+    assert "a" in cache.memory_cache
+    assert cache.get("a") == ["Q1"]
+    assert cache.get("d") is None
+    statistics = cache.get_statistics()
+    assert (statistics["hits"], statistics["misses"], statistics["size"]) == (2, 1, 3)
+    cache.close()
+
+    # entries survive in the database
+    cache = PersistentCache(str(tmp_path / "cache.db"))
+    assert cache.get("c") == ["Q3"]
+    cache.close()
+
+
+def test_stored_and_imported_entries_replace_entries_in_memory(tmp_path):
+    cache = PersistentCache()
+    cache.store("a", ["Q1"])
+    assert cache.get("a") == ["Q1"]
+    cache.store("a", ["Q2"])
+    assert cache.get("a") == ["Q2"]
+    path_to_json_cache = tmp_path / "cache.json"
+    path_to_json_cache.write_text(json.dumps({"a": ["Q3"]}))
+    cache.import_json(str(path_to_json_cache))
+    assert cache.get("a") == ["Q3"]
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from clocq.WikidataSearch import WikidataSearch
+
+# the stub server answers after this delay (in seconds) for search terms starting with "slow"
+SLOW_RESPONSE = 1
+
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    """
+    Stub of the Wikidata search API: search terms starting with "fail" return an error,
+    search terms starting with "slow" are answered after SLOW_RESPONSE seconds.
+    """
+
+    # keep-alive connections
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.server.connections.add(self.client_address)
+        if "srsearch=fail" in self.path:
+            self._respond(500, b"")
+            return
+        if "srsearch=slow" in self.path:
+            time.sleep(SLOW_RESPONSE)
+        body = json.dumps({"query": {"search": [{"title": "Q1"}, {"title": "Property:P2"}]}}).encode()
+        self._respond(200, body)
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSearchHandler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get_url(server):
+    return f"http://127.0.0.1:{server.server_port}/w/api.php"
+
+
+def test_search_term(server):
+    search = WikidataSearch(url=_get_url(server))
+    assert search.search_term("france") == ["Q1", "P2"]
+    assert asyncio.run(search.asearch_term("france")) == ["Q1", "P2"]
+
+
+def test_pooled_connections(server):
+    search = WikidataSearch(url=_get_url(server))
+    for i in range(10):
+        assert search.search_term(f"term {i}") == ["Q1", "P2"]
+    assert server.requests == 10
+    # all requests are sent on the same keep-alive connection
+    assert len(server.connections) == 1
+
+
+def test_bounded_retries(server):
+    search = WikidataSearch(url=_get_url(server), max_retries=3)
+    assert search._request(search._get_params("fail", 10)) is None
+    assert server.requests == 3
+    assert asyncio.run(search._arequest(search._get_params("fail", 10))) is None
+    assert server.requests == 6
+
+
+def test_timeout(server):
+    search = WikidataSearch(url=_get_url(server), timeout=0.1, max_retries=2)
+    start = time.time()
+    assert search._request(search._get_params("slow", 10)) is None
+    # two attempts with a timeout of 0.1s each, and a backoff in between
+    assert time.time() - start < SLOW_RESPONSE
+    assert server.requests == 2
+
+
+def test_executor_created_on_first_use(server):
+    search = WikidataSearch(url=_get_url(server))
+    search.search_term("france")
+    assert search.request_executor is None
+    asyncio.run(search.asearch_term("france"))
+    assert search.request_executor is not None
@@ -16,7 +16,7 @@ setup(
     install_requires=[
         "Flask",
         "hdt",
-        "networkx",
+        "marisa-trie",
         "numpy",
         "pybind11",
         "rank_bm25",